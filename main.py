@@ -5,13 +5,20 @@ from src.agent.react import Answer_ReActAgent
 from src.tools.tools import tools
 from src.core.basellm import base_llm
 import json
+import os
 from datetime import datetime
 import re
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# 从任务总结中提取候选POI数量
+_POI_COUNT_RE = re.compile(r'搜索到(\d+)个候选POI')
 
 class POISelector:
     """POI选择器主类 - 整合构建、存储、交互功能"""
     
+    SKILLS_PATH = "data/skills.json"
+    
     def __init__(
         self,
         large_llm_api: Callable[[str], str],
@@ -39,8 +46,14 @@ class POISelector:
         # 当前决策树数据和文件路径
         self.current_tree: Optional[DecisionTreeData] = None
         self.current_filepath: Optional[str] = None
+        
+        # 经验库的内存副本，首次写入时懒加载
+        self._skills_cache: Optional[list[dict]] = None
+        
+        # 运行环境在进程内不会变化，只探测一次
+        self._is_nb = self._compute_is_notebook()
     
-    def _is_notebook(self) -> bool:
+    def _compute_is_notebook(self) -> bool:
         try:
             from IPython import get_ipython
             ipy = get_ipython()
@@ -50,6 +63,9 @@ class POISelector:
         except (ImportError, NameError, AttributeError):
             return False
     
+    def _is_notebook(self) -> bool:
+        return self._is_nb
+    
     def _display_message(self, message: str, style: str = "info"):
         if self._is_notebook():
             from IPython.display import display, HTML
@@ -84,7 +100,7 @@ class POISelector:
             # 同时保存搜索日志
             if search_log and self.current_filepath:
                 log_filepath = self.current_filepath.replace('.json', '_search_log.json')
-                with open(log_filepath, 'w', encoding='utf-8') as f:
+                with open(log_filepath, 'w', encoding='utf-8', buffering=self.storage.IO_BUFFER_SIZE) as f:
                     json.dump(search_log, f, ensure_ascii=False, indent=2)
                 print(f"搜索日志已保存: {log_filepath}")
         else:
@@ -110,6 +126,26 @@ class POISelector:
         """列出所有已保存的决策树"""
         return self.storage.list_saved_trees()
     
+    def _load_skills(self) -> list[dict]:
+        """懒加载经验库，之后复用内存中的副本"""
+        if self._skills_cache is None:
+            with open(self.SKILLS_PATH, 'r', encoding='utf-8', buffering=self.storage.IO_BUFFER_SIZE) as f:
+                self._skills_cache = json.load(f)
+        return self._skills_cache
+    
+    def _append_skill(self, entry: dict):
+        """
+        追加一条经验并写回经验库
+        
+        先写临时文件再 os.replace 覆盖，避免写入中断导致经验库损坏
+        """
+        skills = self._load_skills()
+        skills.append(entry)
+        tmp_path = self.SKILLS_PATH + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8', buffering=self.storage.IO_BUFFER_SIZE) as f:
+            json.dump(skills, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.SKILLS_PATH)
+    
     def run_interactive(
         self, 
         pois: list[POI] = None, 
@@ -191,9 +227,7 @@ class POISelector:
         
         if self._is_notebook():
             from IPython.display import display, HTML
-            items_html = ""
-            for i, tree in enumerate(trees, 1):
-                items_html += f"""
+            items_html = "".join(f"""
                 <div style="background-color: #fff; border: 1px solid #ddd; border-radius: 5px; padding: 10px; margin: 5px 0;">
                     <p style="margin: 0;"><strong>{i}.</strong> {tree['user_request']}</p>
                     <p style="margin: 5px 0 0 20px; font-size: 12px; color: #666;">
@@ -203,7 +237,7 @@ class POISelector:
                         文件: {tree['filename']}
                     </p>
                 </div>
-                """
+                """ for i, tree in enumerate(trees, 1))
             
             html_content = f"""
             <div style="border: 2px solid #2196F3; border-radius: 10px; padding: 15px; margin: 10px 0; background-color: #e3f2fd;">
@@ -258,39 +292,50 @@ class POISelector:
                                            use_advice=use_skill)
                 
                 self._display_message("总结搜索经验中,后续搜索中可能会用到这些经验...","info")
+                advice_future = None
                 if create_skill:
                     self._display_message(log['任务总结'],"info")
-                    match = re.search(r'搜索到(\d+)个候选POI', log['任务总结'])
-                    poi_count = int(match.group(1))
-                    match1 = re.search(r'搜索到(\d+)个候选POI', log_ref['任务总结'])
-                    poi_count_1 = int(match1.group(1))
-                    if poi_count > poi_count_1*1.5:
-                        gen_advices=gen_advice(topic=user_request,log=log,log_ref=log_ref)
-                        with open('data/skills.json', 'r', encoding='utf-8') as f:
-                            advices = json.load(f)
-                            advices.append({
-                                    "title": f"{user_request}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                                    "content": ["如果搜索"+i['POI类别']+":"+i['经验总结'] for i in gen_advices]
-                            })
-                        with open('data/skills.json', 'w', encoding='utf-8') as f:
-                            json.dump(advices, f, ensure_ascii=False, indent=2)
-                        self._display_message(f"本次任务经验写入data/skills.json中, title:{user_request}_{datetime.now().strftime('%Y%m%d_%H%M%S')}...","info")
+                    match = _POI_COUNT_RE.search(log['任务总结'])
+                    match1 = _POI_COUNT_RE.search(log_ref['任务总结'])
+                    # 任一总结无法解析时按提升不明显处理
+                    if match and match1 and int(match.group(1)) > int(match1.group(1))*1.5:
+                        # 经验总结与决策树构建互不依赖，放到后台线程与之并行执行
+                        advice_executor = ThreadPoolExecutor(max_workers=1)
+                        advice_future = advice_executor.submit(gen_advice, topic=user_request, log=log, log_ref=log_ref)
+                        advice_executor.shutdown(wait=False)
                     else:
                         self._display_message("在线优化后提升不明显，本次任务不总结经验...","info")
                 ###获取log结果里的poi_list
-                POI_list=[]
+                # 按POI名称去重（与POI.__eq__一致），保留首次出现的顺序
+                seen_pois=dict()
                 for item in log['执行日志']:
                     POIs=item['搜索POI']
                     for POI_item in POIs:
-                        if POI_item.endswith('是'):
-                            poi=POI(POI_item.split(',')[0],POI_item.split(',')[1][3:])
-                            POI_list.append(poi)
-                pois=list(set(POI_list))
+                        if not POI_item.endswith('是'):
+                            continue
+                        parts=POI_item.split(',',2)
+                        if parts[0] not in seen_pois:
+                            seen_pois[parts[0]]=POI(parts[0],parts[1][3:])
+                pois=list(seen_pois.values())
                 
                 ###build决策树###
                 # 合并 log 和 search_logs 用于保存（search_logs 单独存储避免优化时内容过长）
                 full_search_log = {**log, '搜索详细日志': search_logs}
                 self.build_tree(pois, user_request, search_log=full_search_log)
+                if advice_future is not None:
+                    # 经验总结是后台的附带任务，失败时只提示，不影响进入交互选择
+                    try:
+                        gen_advices=advice_future.result()
+                    except Exception as e:
+                        gen_advices=None
+                        self._display_message(f"本次任务经验总结失败，不写入经验库: {e}","warning")
+                    if gen_advices is not None:
+                        skill_title=f"{user_request}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                        self._append_skill({
+                                "title": skill_title,
+                                "content": ["如果搜索"+i['POI类别']+":"+i['经验总结'] for i in gen_advices]
+                        })
+                        self._display_message(f"本次任务经验写入{self.SKILLS_PATH}中, title:{skill_title}...","info")
                 self.run_interactive(allow_restart=True)
             
             elif choice == "2":
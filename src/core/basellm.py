@@ -1,35 +1,42 @@
 from openai import OpenAI
-import pandas as pd
-import os
-import time
 from config import (
     SILICONFLOW_API_KEY,
     SILICONFLOW_API_BASE
 )
 
+# 模块级共享客户端：复用底层连接池，避免每次调用都重新建立 TCP/TLS 连接
+_client = OpenAI(
+    api_key=SILICONFLOW_API_KEY,
+    base_url=SILICONFLOW_API_BASE
+)
+
+# call_with_messages_small 固定使用的 system 消息，各次调用共用同一个字典
+_SMALL_SYSTEM_MESSAGE = {"role": "system", "content": "You are a helpful assistant."}
+
 
 class base_llm():
     def __init__(self, system_prompt):
         self.system_prompt = system_prompt
+        # 系统提示词在实例生命周期内不变，拼接用的前缀只构建一次
+        self._prompt_prefix = system_prompt + '\n'
         self.api_key = SILICONFLOW_API_KEY
         self.base_url = SILICONFLOW_API_BASE
 
-    def call_with_messages_R1(self, prompt_info, temp=0.1, max_tokens=8192):
+    def call_with_messages_R1(self, prompt_info, temp=0.1, max_tokens=8192, response_format=None):
         res = self.call_with_messages_V3(prompt_info=prompt_info, temp=temp,
-                                         model_name="Pro/deepseek-ai/DeepSeek-R1", max_tokens=max_tokens)
+                                         model_name="Pro/deepseek-ai/DeepSeek-R1", max_tokens=max_tokens,
+                                         response_format=response_format)
         return res
 
-    def call_with_messages_V3(self, prompt_info, temp=0.1, model_name="Pro/deepseek-ai/DeepSeek-V3.2", max_tokens=8192):
+    def call_with_messages_V3(self, prompt_info, temp=0.1, model_name="Pro/deepseek-ai/DeepSeek-V3.2", max_tokens=8192, response_format=None):
         #SiliconFlow-API
-        prompt=self.system_prompt+'\n'+prompt_info
-        client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
-        )
+        prompt=self._prompt_prefix+prompt_info
+        # response_format 如 {"type": "json_object"}，要求模型直接输出合法 JSON；不传时保持默认
+        extra_args={"response_format": response_format} if response_format else {}
         print(len(prompt))
         for attempt in range(5):
             try:
-                completion = client.chat.completions.create(
+                completion = _client.chat.completions.create(
                     model=model_name,
                     messages=[
                         {
@@ -39,6 +46,7 @@ class base_llm():
                     ],
                     temperature=temp,
                     max_tokens=max_tokens,
+                    **extra_args,
                 )
                 response=completion.choices[0].message.content
                 result=response.split('</think>')[-1].strip() if response else ""
@@ -56,15 +64,11 @@ class base_llm():
         return -1
 
     def call_with_messages_small(self, prompt_info, temp=0, model_name="Qwen/Qwen3-8B", max_tokens=4096):
-        prompt=self.system_prompt+'\n'+prompt_info
-        client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url
-        )
-        completion = client.chat.completions.create(
+        prompt=self._prompt_prefix+prompt_info
+        completion = _client.chat.completions.create(
             model=model_name,
             messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
+                _SMALL_SYSTEM_MESSAGE,
                 {
                     "role": "user",
                     "content": prompt,
@@ -111,12 +111,15 @@ def poi_parse_prompt(content):
 '''%(content)
     return prompt
 
-def agent_match_prompt(user_query,poi_info):
+def agent_match_prompt_header(user_query):
     prompt='''你是一个旅行助手agent,请根据用户请求和poi信息，判断该poi是否与用户请求相匹配。
 
 【用户请求】
 %s
-【poi信息】
+'''%(user_query)
+    return prompt
+def agent_match_prompt_body(poi_info):
+    prompt='''【poi信息】
 %s
 
 ------------------------
@@ -125,7 +128,28 @@ def agent_match_prompt(user_query,poi_info):
 "是否匹配":"是/否"，
 "判断理由":"xxxxxx"
 }
-'''%(user_query,poi_info)
+'''%(poi_info,)
+    return prompt
+def agent_match_prompt(user_query,poi_info):
+    # 拆成与请求相关的固定前缀和每个POI的部分，同一请求下前缀可以只构建一次
+    return agent_match_prompt_header(user_query)+agent_match_prompt_body(poi_info)
+def agent_match_prompt_batch(user_query,poi_list):
+    poi_text='\n'.join(['%d. %s'%(i+1,poi_info) for i,poi_info in enumerate(poi_list)])
+    prompt='''你是一个旅行助手agent,请根据用户请求和以下编号的多个poi信息，逐个判断每个poi是否与用户请求相匹配。
+
+【用户请求】
+%s
+【poi信息】
+%s
+
+------------------------
+判断结果请按照以下格式给出，按poi编号顺序输出一个包含%d个判断结果的数组，输出结果中不要包含其他内容。
+[{
+"是否匹配":"是/否",
+"判断理由":"xxxxxx"
+},
+...]
+'''%(user_query,poi_text,len(poi_list))
     return prompt
 def troubleshoot_prompt(user_query,cur_log,criteria,max_steps=2):
     prompt='''你是一个旅行计划规划专家，现在有一个使用社交平台工具搜索候选POI的搜索计划和执行结果。请你根据搜索候选POI的评判标准，选出当前执行计划中最值得改进的步骤。注意:
@@ -180,7 +204,7 @@ def new_step_prompt(user_query,cur_step,advice):
 【改进建议】
 %s
 ------------------------
-请按照以下格式输出改进后的搜索计划,注意你的搜索计划中不要有别的内容。
+请按照以下JSON格式输出改进后的搜索计划,注意你的搜索计划中不要有别的内容。
 {
 "行动步骤":"x",(与当前步骤中一致)
 "行动规划":"xxxx",
@@ -199,7 +223,7 @@ def new_sample_prompt(user_query,cur_plan):
 【当前计划】
 %s
 ------------------------
-请按照以下格式输出补充的搜索步骤,注意你的输出结果中不要有别的内容。
+请按照以下JSON格式输出补充的搜索步骤,注意你的输出结果中不要有别的内容。
 {
 "行动步骤":"x",
 "行动规划":"xxxx",
@@ -3,19 +3,37 @@ from src.core.basellm import base_llm
 import numpy as np
 from numpy.linalg import norm
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from config import EMBEDDING_API_URL, EMBEDDING_API_KEY, EMBEDDING_MODEL
 
 API_URL = EMBEDDING_API_URL
 API_KEY = EMBEDDING_API_KEY
+# (连接超时, 读取超时)，单位秒
+REQUEST_TIMEOUT = (10, 60)
 
-def create_embedding_single(text, model="BAAI/bge-large-zh-v1.5"):
+# 模块级共享会话，复用 keep-alive 连接（并行采样时多线程共用连接池）
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
+# 嵌入向量缓存 {sha256(模型名+文本): 向量}，相同文本不重复请求
+_embedding_cache = {}
+# 嵌入向量的存储精度：去重/多样性只用到余弦相似度，float16 足够，内存减半；
+# 计算相似度时仍转回 float32 走 BLAS 矩阵乘法
+EMBEDDING_DTYPE = np.float16
+
+def _request_embeddings(texts, model="BAAI/bge-large-zh-v1.5"):
     """
-    创建单个文本的嵌入向量
+    一次请求嵌入接口，返回多个文本的嵌入向量
     
     参数:
-        text: 要嵌入的文本字符串
+        texts: 要嵌入的文本字符串列表
         model: 模型名称，默认为 BAAI/bge-large-zh-v1.5
+    
+    返回:
+        接口返回的 JSON（data 中每项对应一个文本），请求失败时返回 None
     """
     headers = {
         "Authorization": f"Bearer {API_KEY}",
@@ -24,11 +42,15 @@ def create_embedding_single(text, model="BAAI/bge-large-zh-v1.5"):
     
     data = {
         "model": model,
-        "input": text,
+        "input": texts,
         "encoding_format": "float"  # 可选: "float" 或 "base64"
     }
     
-    response = requests.post(API_URL, headers=headers, json=data)
+    try:
+        response = _session.post(API_URL, headers=headers, json=data, timeout=REQUEST_TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        print(f"错误: {e}")
+        return None
     
     if response.status_code == 200:
         return response.json()
@@ -37,23 +59,44 @@ def create_embedding_single(text, model="BAAI/bge-large-zh-v1.5"):
         print(response.text)
         return None
 
-def cosine_similarity(vec1, vec2):
+def _embedding_key(text, model):
+    """嵌入缓存的键：模型名与文本的 SHA256"""
+    return hashlib.sha256(f"{model}\n{text}".encode('utf-8')).hexdigest()
+
+def create_embeddings_batch(texts, model="BAAI/bge-large-zh-v1.5"):
     """
-    计算两个向量的余弦相似度
-    
+    一次请求批量创建多个文本的嵌入向量
+
     参数:
-        vec1: 第一个向量（列表或numpy数组）
-        vec2: 第二个向量（列表或numpy数组）
-    
+        texts: 要嵌入的文本字符串列表
+        model: 模型名称，默认为 BAAI/bge-large-zh-v1.5
+
     返回:
-        余弦相似度值（范围 -1 到 1，值越接近1表示越相似）
+        与 texts 顺序一致的嵌入向量列表（EMBEDDING_DTYPE 的一维数组），请求失败时返回 None
+    """
+    keys = [_embedding_key(text, model) for text in texts]
+    # 只请求缓存中没有的文本（同一批内重复的文本也只请求一次）
+    missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in _embedding_cache))
+    if missing:
+        res = _request_embeddings(missing, model=model)
+        if res is None:
+            return None
+        # 按 index 还原输入顺序（sorted 是稳定排序，缺少 index 时保持返回顺序）
+        data = sorted(res['data'], key=lambda x: x.get('index', 0))
+        for text, item in zip(missing, data):
+            _embedding_cache[_embedding_key(text, model)] = np.asarray(item['embedding'], dtype=EMBEDDING_DTYPE)
+    return [_embedding_cache[key] for key in keys]
+
+def normalize_embeddings(embeddings):
     """
-    vec1 = np.array(vec1)
-    vec2 = np.array(vec2)
+    将嵌入向量堆叠为 (n, d) 的 float32 矩阵，并把每一行归一化为单位长度
     
-    # 余弦相似度公式: (A·B) / (||A|| * ||B||)
-    similarity = np.dot(vec1, vec2) / (norm(vec1) * norm(vec2))
-    return similarity
+    归一化之后，两两余弦相似度就是矩阵乘积 E @ E.T
+    """
+    E = np.asarray(embeddings, dtype=np.float32)
+    norms = norm(E, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return E / norms
 
 def select_diverse_items(items, k):
     """
@@ -63,70 +106,77 @@ def select_diverse_items(items, k):
     if len(items) <= k:
         return items
     
-    # 预计算相似度矩阵
-    n = len(items)
-    embeddings = [item['embedding'] for item in items]
-    sim_matrix = [[cosine_similarity(embeddings[i], embeddings[j]) 
-                   for j in range(n)] for i in range(n)]
-    
-    selected_indices = []
-    remaining = set(range(n))
+    # 不构建 n×n 相似度矩阵，每轮只计算各项与新选中项的相似度（一次矩阵-向量乘法）
+    E = normalize_embeddings([item['embedding'] for item in items])
     
-    # 选第一个：可以随机选，或选embedding范数最大的
-    first = remaining.pop()
-    selected_indices.append(first)
+    # 选第一个：与其余各项平均相似度最低的项（mean(E @ E.T, axis=1) 等于 E @ E.sum(0) / n）
+    first = int((E @ E.sum(axis=0)).argmin())
+    selected_indices = [first]
+    # 每一项与已选集合的最大相似度，每轮只需与新选中的项比较一次；
+    # 已选项置为 inf（np.maximum 不会再改变它），argmin 时自然被排除
+    max_sim_to_selected = E @ E[first]
+    max_sim_to_selected[first] = np.inf
     
     # 贪心选择剩余k-1个
     for _ in range(k - 1):
-        best_idx = None
-        best_min_sim = float('inf')
-        
-        for idx in remaining:
-            # 计算该项与已选集合的最大相似度
-            max_sim_to_selected = max(sim_matrix[idx][s] for s in selected_indices)
-            # 选择"与已选集合最不相似"的项
-            if max_sim_to_selected < best_min_sim:
-                best_min_sim = max_sim_to_selected
-                best_idx = idx
-        
-        if best_idx is not None:
-            selected_indices.append(best_idx)
-            remaining.remove(best_idx)
+        # 选择"与已选集合最不相似"的项
+        best_idx = int(max_sim_to_selected.argmin())
+        selected_indices.append(best_idx)
+        np.maximum(max_sim_to_selected, E @ E[best_idx], out=max_sim_to_selected)
+        max_sim_to_selected[best_idx] = np.inf
     
     return [items[i] for i in selected_indices]
 
+def _sample_analysis(llm, prompt):
+    """采样一次经验总结并解析为列表"""
+    res = llm.call_with_messages_R1(prompt, temp=1.0)
+    return json.loads(res)
+
 def gen_advice(topic, log, log_ref, samples=10, 
-               dedup_threshold=0.87, diversity_count=None):
+               dedup_threshold=0.87, diversity_count=None, max_workers=5):
     """
     生成并筛选多样化的经验建议
     
     Args:
         diversity_count: 最终需要保留的经验数量（基于最大多样性选择）
+        max_workers: 并行采样的最大线程数
     """
     advice_list = []
+    kept_matrix = None  # 已保留经验的归一化嵌入矩阵，形状 (len(advice_list), d)
+    kept_texts = set()  # 已保留经验的文本，用于精确去重
     llm = base_llm(system_prompt="")
     
-    # === 阶段1：采样生成并初步去重 ===
-    for i in range(samples):
+    # === 阶段1：并行采样生成，再按采样顺序依次去重 ===
+    prompt = experience_analysis_prompt(topic, json.dumps(log_ref, ensure_ascii=False), json.dumps(log, ensure_ascii=False))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_sample_analysis, llm, prompt) for _ in range(samples)]
+    
+    for i, future in enumerate(futures):
         try:
-            prompt = experience_analysis_prompt(topic, log_ref, log)
-            res = llm.call_with_messages_R1(prompt, temp=1.0)
-            analysis_res = json.loads(res)
+            analysis_res = future.result()
         except Exception as e:
             print(f"Sample {i} failed: {e}")
             continue
             
-        for item in analysis_res:
-            embed = create_embedding_single(item['经验总结'])['data'][0]['embedding']
+        # 先按文本精确去重：与已保留经验完全相同的直接跳过，不再请求嵌入和计算相似度
+        analysis_res = [item for item in analysis_res if item['经验总结'].strip() not in kept_texts]
+        if not analysis_res:
+            continue
+        # 同一次采样的经验一次性批量获取嵌入向量
+        embeds = create_embeddings_batch([item['经验总结'] for item in analysis_res])
+        if embeds is None:
+            print(f"Sample {i} embedding failed")
+            continue
+
+        for item, embed, vec in zip(analysis_res, embeds, normalize_embeddings(embeds)):
             item['embedding'] = embed
             
-            # 与已有项比较，去重
-            is_duplicate = any(
-                cosine_similarity(embed, cand['embedding']) >= dedup_threshold
-                for cand in advice_list
-            )
-            if not is_duplicate:
-                advice_list.append(item)
+            # 与已有项比较，去重（一次矩阵-向量乘法得到与全部已有项的相似度）
+            if kept_matrix is not None and (kept_matrix @ vec).max() >= dedup_threshold:
+                continue
+            advice_list.append(item)
+            kept_texts.add(item['经验总结'].strip())
+            kept_matrix = vec[None, :] if kept_matrix is None else np.vstack([kept_matrix, vec])
     
     # === 阶段2：基于最大边际相关性(MMR)选择多样化子集 ===
     if diversity_count is None or diversity_count >= len(advice_list):
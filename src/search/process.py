@@ -5,23 +5,116 @@ from src.agent.react import Search_ReActAgent
 from src.tools.tools import tools
 import json
 import re
+import os
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
-def summary_log(agent):
+# 让模型直接输出合法 JSON 对象（输出为数组的 troubleshoot 和 R1 的 refine 仍走文本提取）
+JSON_OBJECT_FORMAT={"type": "json_object"}
+
+# troubleshoot 提示词中日志的长度上限（字符数），超过时压缩为最近 MAX_STEPS_IN_LOG 个步骤
+MAX_LOG_CHARS=12000
+MAX_STEPS_IN_LOG=8
+
+# JSON 提取用的正则（模块级预编译）
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*([\s\S]*?)\s*```')
+_JSON_ARRAY_RE = re.compile(r'\[[\s\S]*\]')
+
+def _extract_json_obj(text):
+    """
+    从文本中提取第一个括号配平的 JSON 对象，找不到时返回 None
+
+    逐字符扫描一遍并跳过字符串内的括号，耗时与文本长度成线性，不会出现正则回溯
+    """
+    start=text.find('{')
+    if start==-1:
+        return None
+    depth=0
+    in_str=False
+    escape=False
+    for i in range(start,len(text)):
+        ch=text[i]
+        if in_str:
+            if escape:
+                escape=False
+            elif ch=='\\':
+                escape=True
+            elif ch=='"':
+                in_str=False
+        elif ch=='"':
+            in_str=True
+        elif ch=='{':
+            depth+=1
+        elif ch=='}':
+            depth-=1
+            if depth==0:
+                return text[start:i+1]
+    return None
+
+SKILLS_PATH='data/skills.json'
+# 拼接进规划提示词的经验条数上限
+MAX_ADVICE_COUNT=100
+# 经验库缓存 (文件修改时间, 拼接好的经验文本)，经验库被改写后自动重新读取
+_advice_cache=None
+_advice_lock=threading.Lock()
+
+def _load_advice():
+    """读取经验库，返回前 MAX_ADVICE_COUNT 条经验拼接成的文本（每条一行）"""
+    global _advice_cache
+    mtime=os.stat(SKILLS_PATH).st_mtime_ns
+    with _advice_lock:
+        if _advice_cache is None or _advice_cache[0]!=mtime:
+            with open(SKILLS_PATH, 'r', encoding='utf-8') as f:
+                advices = json.load(f)
+            lines=islice((advice for item in advices for advice in item['content']),MAX_ADVICE_COUNT)
+            _advice_cache=(mtime,''.join(advice+'\n' for advice in lines))
+        return _advice_cache[1]
+
+def summary_log(agent, max_steps_in_log=None):
+    """
+    汇总搜索日志
+
+    Args:
+        max_steps_in_log: 为 None 时保留全部步骤；否则只保留最近的 max_steps_in_log 个步骤，
+                          并且已在前面步骤出现过的POI不再重复附带简介（用于压缩提示词长度）
+
+    同一POI以相同的匹配结果再次出现时只输出 "POI名称(重复)"，
+    因此按 "是否匹配:是" 结尾筛选POI时，每个POI仍保留首次匹配成功的完整记录
+    """
     res_log=dict()
-    res_log['执行日志']=list()
     process_log=agent.logger.log['process']
+    step_keys=list(process_log.keys())
+    step_count=len(step_keys)
+    if max_steps_in_log is not None and step_count>max_steps_in_log:
+        res_log['省略说明']="已省略前%d步"%(step_count-max_steps_in_log)
+        step_keys=step_keys[-max_steps_in_log:]
+    res_log['执行日志']=list()
+    compact=max_steps_in_log is not None
+    seen_pois=dict()  # POI名称 -> 已输出过的匹配结果集合
     total_comments=0
-    step_count=0
-    for i in process_log.keys():
+    for i in step_keys:
         res_step=dict()
         log=process_log[i]
         res_step['行动步骤']=log['行动步骤']
         res_step['行动规划']=log['行动规划']
         res_step['搜索请求']=log['搜索请求']
-        res_step['搜索POI']=[item['POI名称']+",简介:"+item['POI简介']+",是否匹配:"+item['是否匹配'] for item in log['执行结果']]
+        poi_strs=[]
+        for item in log['执行结果']:
+            name=item['POI名称']
+            match=item['是否匹配']
+            emitted=seen_pois.setdefault(name,set())
+            if match in emitted:
+                # 前面已经以相同匹配结果列出过该POI，只标记重复
+                poi_strs.append(name+"(重复)")
+            elif emitted and compact:
+                poi_strs.append("".join((name,",是否匹配:",match)))
+            else:
+                poi_strs.append("".join((name,",简介:",item['POI简介'],",是否匹配:",match)))
+            emitted.add(match)
+        res_step['搜索POI']=poi_strs
         res_step['步骤总结']=log['执行总结']
         res_log['执行日志'].append(res_step)
-        step_count+=1
     ##总comments##
     for item in agent.logger.log['final_res']:
         total_comments+=len(item['好评内容'])+len(item['差评内容'])
@@ -30,6 +123,41 @@ def summary_log(agent):
     res_log['任务总结']="本次任务共执行%d次,共搜索到%d个候选POI,以及%d个与候选POI相关评论。"%(step_count,total_pois,total_comments)
     return res_log
 
+def _optimize_step(llm, searcher, plan_list, topic, item, step_key, refine):
+    """为单个问题步骤生成新的执行步骤：refine 为 True 时基于修改建议修正，否则重新采样"""
+    if refine:
+        print(f"start optimization solution for step {step_key}!")
+        search_content=searcher.logger.log['process'][step_key]['搜索过程']
+        for step_plan in plan_list:
+            if str(step_plan['行动步骤']) == step_key:
+                cur_plan=step_plan
+                break
+        cur_problem=item['当前问题']
+        opt_prompt=refine_prompt(search_content,cur_problem,cur_plan)
+        opt_advice=llm.call_with_messages_R1(opt_prompt,temp=0)
+        # 清理 markdown 代码块并解析 JSON
+        opt_advice_match = _CODE_BLOCK_RE.search(opt_advice)
+        if opt_advice_match:
+            opt_advice_clean = opt_advice_match.group(1)
+        else:
+            opt_advice_clean = _extract_json_obj(opt_advice)
+        suggestion=json.loads(opt_advice_clean)['修改建议']
+        item['修改建议']=suggestion
+        print(suggestion)
+        new_prompt=new_step_prompt(searcher.query,cur_plan,str(item))
+        new_step=llm.call_with_messages_V3(new_prompt,temp=0,response_format=JSON_OBJECT_FORMAT)
+        try:
+            return json.loads(new_step)
+        except json.JSONDecodeError:
+            # 兼容未按 JSON 模式输出的情况，从文本中提取 JSON 对象
+            return json.loads(_extract_json_obj(new_step))
+    print(f"start new sample solution for step {step_key}!")
+    new_sampleprompt=new_sample_prompt(topic,searcher.logger.log['plan'])
+    new_step=llm.call_with_messages_V3(new_sampleprompt,temp=0.6,response_format=JSON_OBJECT_FORMAT)
+    new_step_res=json.loads(new_step)
+    new_step_res['行动步骤']=step_key
+    return new_step_res
+
 def search_process(topic, on_policy_opt=True, maximum_opt_iterations=5, steps_per_iteration=2, use_advice=False):
     llm = base_llm(system_prompt="")
     executor = Search_ReActAgent(llm_client=llm, tools=tools)
@@ -39,15 +167,7 @@ def search_process(topic, on_policy_opt=True, maximum_opt_iterations=5, steps_pe
             print(f"start initial plan of request: {topic}.\nrepeats {retry}")
             searcher=search_agent(executor,llm,topic)
             if use_advice:
-                with open('data/skills.json', 'r', encoding='utf-8') as f:
-                    advices = json.load(f)
-                total_advice=''
-                advice_count=0
-                for item in advices:
-                    for advice in item['content']:
-                        if advice_count<100:
-                            total_advice+=advice+'\n'
-                            advice_count+=1
+                total_advice=_load_advice()
                 plan=searcher.self_plan_advice(total_advice,sample_temperature=0.1)
                 result=searcher.execution(plan)
                 break
@@ -70,48 +190,34 @@ def search_process(topic, on_policy_opt=True, maximum_opt_iterations=5, steps_pe
                     print(f"start optimization trial of {j+1},retry {retry}")
                     new_steps=dict()
                     crit="-最终将按照以下标准判断候选POI搜索结果的质量：1.搜索出来的尽量多的候选POI；2.每个候选POI都必须与用户的请求相关；"
-                    troubleshoot=troubleshoot_prompt(topic,str(log),crit,max_steps=steps_per_iteration)
+                    log_text=json.dumps(log,ensure_ascii=False)
+                    if len(log_text)>MAX_LOG_CHARS:
+                        # 日志过长时只保留最近的步骤，并省略重复POI的简介，控制提示词长度
+                        log_text=json.dumps(summary_log(searcher,max_steps_in_log=MAX_STEPS_IN_LOG),ensure_ascii=False)
+                    troubleshoot=troubleshoot_prompt(topic,log_text,crit,max_steps=steps_per_iteration)
                     troubleshoot_res=llm.call_with_messages_R1(troubleshoot,temp=retry*0.2)
-                    match = re.search(r'\[[\s\S]*\]', troubleshoot_res)
+                    match = _JSON_ARRAY_RE.search(troubleshoot_res)
                     json_str = match.group()
                     opt_res=json.loads(json_str)
                     print(opt_res)
+                    # 先按当前计数顺序确定每个步骤是修正还是重新采样，再并行执行，避免并发修改计数
+                    pending_steps=list(optimization_steps)
+                    step_tasks=[]
                     for item in opt_res:
                         step_key = str(item['行动步骤'])  # 统一转换为字符串
-                        search_content=searcher.logger.log['process'][step_key]['搜索过程']
-                        for step_plan in json.loads(searcher.logger.log['plan']):
-                            if str(step_plan['行动步骤']) == step_key:
-                                cur_plan=step_plan
-                                break
-                        if optimization_steps.count(step_key)<optimization_maxtimes:
-                            print(f"start optimization solution for step {step_key}!")
-                            cur_problem=item['当前问题']
-                            opt_prompt=refine_prompt(search_content,cur_problem,cur_plan)
-                            opt_advice=llm.call_with_messages_R1(opt_prompt,temp=0)
-                            # 清理 markdown 代码块并解析 JSON
-                            opt_advice_match = re.search(r'```(?:json)?\s*([\s\S]*?)\s*```', opt_advice)
-                            if opt_advice_match:
-                                opt_advice_clean = opt_advice_match.group(1)
-                            else:
-                                opt_advice_clean = re.search(r'\{[\s\S]*\}', opt_advice).group()
-                            suggestion=json.loads(opt_advice_clean)['修改建议']
-                            item['修改建议']=suggestion
-                            print(suggestion)
-                            new_prompt=new_step_prompt(searcher.query,cur_plan,str(item))
-                            new_step=llm.call_with_messages_V3(new_prompt,temp=0)
-                            pattern = r"\{[^{}]*(?:'[^']*'[^{}]*)*\}"
-                            match=re.search(pattern, new_step)
-                            new_step_res=json.loads(match.group())
-                            new_steps[step_key]=new_step_res
-                            optimization_steps.append(step_key)
+                        if pending_steps.count(step_key)<optimization_maxtimes:
+                            step_tasks.append((item,step_key,True))
+                            pending_steps.append(step_key)
                         else:
-                            print(f"start new sample solution for step {step_key}!")
-                            new_sampleprompt=new_sample_prompt(topic,searcher.logger.log['plan'])
-                            new_step=llm.call_with_messages_V3(new_sampleprompt,temp=0.6)
-                            new_step_res=json.loads(new_step)
-                            new_step_res['行动步骤']=step_key
-                            new_steps[step_key]=new_step_res
-                            optimization_steps = [x for x in optimization_steps if x != step_key]
+                            step_tasks.append((item,step_key,False))
+                            pending_steps = [x for x in pending_steps if x != step_key]
+                    plan_list=json.loads(searcher.logger.log['plan'])
+                    with ThreadPoolExecutor(max_workers=max(1,len(step_tasks))) as pool:
+                        futures=[pool.submit(_optimize_step,llm,searcher,plan_list,topic,item,step_key,refine)
+                                 for item,step_key,refine in step_tasks]
+                    for (item,step_key,refine),future in zip(step_tasks,futures):
+                        new_steps[step_key]=future.result()
+                    optimization_steps=pending_steps
                     result=searcher.revise_execution(new_steps)
                     break
                 except Exception as e:
@@ -1,9 +1,50 @@
-from src.core.prompts import search_plan_prompt,search_opt_plan_prompt,agent_match_prompt
+from src.core.prompts import search_plan_prompt,search_opt_plan_prompt,agent_match_prompt_header,agent_match_prompt_body,agent_match_prompt_batch
 import json
 import re
 import pytz
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import copy
+from concurrent.futures import ThreadPoolExecutor
+
+# 评估POI匹配度的共享线程池（LLM 调用为网络 IO，所有步骤共用）
+MATCH_EVAL_WORKERS = 32
+# 每次 LLM 调用合并评估的POI数量
+MATCH_EVAL_BATCH_SIZE = 8
+_MATCH_EVAL_POOL = ThreadPoolExecutor(max_workers=MATCH_EVAL_WORKERS, thread_name_prefix="match_eval")
+
+# extract_json_from_response 用到的正则（模块级预编译）
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL)
+_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*(.*?)\s*```', re.DOTALL)
+_JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+
+
+def _poi_text_size(poi_info):
+    """POI在评估提示词中的大致文本长度（简介加全部评论）"""
+    return (len(poi_info['POI简介'])
+            + sum(len(c) for c in poi_info['好评内容'])
+            + sum(len(c) for c in poi_info['差评内容']))
+
+
+def _comment_key(comment):
+    """评论去重用的键：LLM 输出的评论可能是字典、列表等不可哈希的值，统一转为字符串"""
+    if isinstance(comment, str):
+        return comment
+    return json.dumps(comment, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _merge_comments(target, comments):
+    """把 comments 中尚未出现的评论按原顺序追加到 target（合并时即去重）"""
+    seen = {_comment_key(comment) for comment in target}
+    for comment in comments:
+        key = _comment_key(comment)
+        if key not in seen:
+            seen.add(key)
+            target.append(comment)
+
+
+def _format_match_res(match_res, with_reason=False):
+    """把POI匹配结果格式化为每行一个POI的文本，写入步骤的搜索过程"""
+    if with_reason:
+        return '\n'.join(f"{item['POI名称']},是否匹配:{item['是否匹配']},理由:{item['判断理由']}" for item in match_res)
+    return '\n'.join(f"{item['POI名称']},是否匹配:{item['是否匹配']}" for item in match_res)
 
 
 def extract_json_from_response(response: str) -> str:
@@ -16,20 +57,27 @@ def extract_json_from_response(response: str) -> str:
     Returns:
         清理后的 JSON 字符串
     """
-    # 尝试匹配 ```json ... ``` 或 ``` ... ``` 代码块
-    code_block_pattern = r'```(?:json)?\s*([\s\S]*?)\s*```'
-    match = re.search(code_block_pattern, response)
-    if match:
-        return match.group(1).strip()
+    # 去掉推理模型输出的 <think>...</think> 思考内容
+    if '<think>' in response:
+        response = _THINK_RE.sub('', response)
+    stripped = response.strip()
+    # 最常见的情况：模型直接输出了 JSON 数组，无需正则
+    if stripped.startswith('[') and stripped.endswith(']'):
+        return stripped
+
+    # 尝试匹配 ```json ... ``` 或 ``` ... ``` 代码块（没有代码块标记时跳过正则）
+    if '```' in response:
+        match = _CODE_BLOCK_RE.search(response)
+        if match:
+            return match.group(1).strip()
 
     # 如果没有代码块标记，尝试直接匹配 JSON 数组
-    json_array_pattern = r'\[[\s\S]*\]'
-    match = re.search(json_array_pattern, response)
+    match = _JSON_ARRAY_RE.search(response)
     if match:
         return match.group(0)
 
     # 如果都没匹配到，返回原始内容（去除首尾空白）
-    return response.strip()
+    return stripped
 
 class search_logger():
     def __init__(self,llm,query):
@@ -38,122 +86,193 @@ class search_logger():
         self.log['query']=query
         self.log['process']=dict()
         self.log['final_res']=list()
-        self.log['final_feeds']=list()
+        self.log['final_feeds']=set()  # 已搜索过的网页，集合便于查重
         self.log['search_logs']=dict()  # 存储每个步骤的搜索日志
         self.llm=llm
+        self._eval_cache=dict()  # (POI名称, POI简介) -> 匹配评估结果
+        self._match_prompt_header=agent_match_prompt_header(query)  # 同一请求下所有POI共用的评估提示词前缀
+    # 缺少必需key时填充的默认值（列表类型在填充时复制，避免多个POI共用同一个列表）
+    _POI_DEFAULTS = {'POI名称': '未命名POI', 'POI简介': '', '好评内容': [], '差评内容': []}
     def _clean_keys(self,poi_list, valid_keys=['POI名称', 'POI简介', '好评内容', '差评内容']):
         cleaned_list = []
+        warnings = []  # 警告信息最后统一输出一次
+        valid_set = set(valid_keys)
         for i, poi in enumerate(poi_list):
-            cleaned_poi = {}
-            removed_keys = []
+            if poi.keys() == valid_set:
+                # 常见情况：key已经符合规范，直接复制，跳过逐个key的检查
+                cleaned_poi = dict(poi)
+            else:
+                # 一次遍历保留规范的key
+                cleaned_poi = {key: value for key, value in poi.items() if key in valid_set}
 
-            # 检查每个key
-            for key in poi.keys():
-                if key in valid_keys:
-                    cleaned_poi[key] = poi[key]
-                else:
-                    removed_keys.append(key)
-
-            # 如果有不符合规范的key,打印警告信息
-            if removed_keys:
-                print(f"⚠️ POI索引 {i} (名称: {poi.get('POI名称', '未知')}) 删除了不规范的key: {removed_keys}")
-
-            # 检查是否缺少必需的key
-            missing_keys = [k for k in valid_keys if k not in cleaned_poi]
-            if missing_keys:
-                print(f"⚠️ POI索引 {i} (名称: {poi.get('POI名称', '未知')}) 缺少必需的key: {missing_keys}")
-                # 为缺失的key添加默认值
-                for key in missing_keys:
-                    if key == 'POI名称':
-                        cleaned_poi[key] = '未命名POI'
-                    elif key == 'POI简介':
-                        cleaned_poi[key] = ''
-                    elif key in ['好评内容', '差评内容']:
-                        cleaned_poi[key] = []
+                # 如果有不符合规范的key,记录警告信息
+                if len(cleaned_poi) != len(poi):
+                    removed_keys = [key for key in poi if key not in valid_set]
+                    warnings.append(f"⚠️ POI索引 {i} (名称: {poi.get('POI名称', '未知')}) 删除了不规范的key: {removed_keys}")
+
+                # 检查是否缺少必需的key
+                if len(cleaned_poi) != len(valid_set):
+                    missing_keys = [k for k in valid_keys if k not in cleaned_poi]
+                    warnings.append(f"⚠️ POI索引 {i} (名称: {poi.get('POI名称', '未知')}) 缺少必需的key: {missing_keys}")
+                    # 为缺失的key添加默认值
+                    for key in missing_keys:
+                        if key in self._POI_DEFAULTS:
+                            default = self._POI_DEFAULTS[key]
+                            cleaned_poi[key] = list(default) if isinstance(default, list) else default
+
+            # 评论在进入时去重并保留原有顺序，之后的合并只追加新评论
+            for key in ('好评内容', '差评内容'):
+                if isinstance(cleaned_poi[key], list):
+                    comments = []
+                    _merge_comments(comments, cleaned_poi[key])
+                    cleaned_poi[key] = comments
 
             cleaned_list.append(cleaned_poi)
+        if warnings:
+            print('\n'.join(warnings))
         return cleaned_list
     def summary_step(self,search_res,feed_list):
         total_pois=len(search_res)
-        total_feeds=len(set(feed_list))
+        new_feeds=set(feed_list)
+        total_feeds=len(new_feeds)
         existed_related_pois=0
         new_realted_pois=0
-        existed_feeds=0
         new_unrelated_pois=0
         new_comments=0
         ###检查feed_id###
-        for feed in list(set(feed_list)):
-            if feed in self.log['final_feeds']:
-                existed_feeds+=1
-            else:
-                self.log['final_feeds'].append(feed)
+        existed_feeds=len(new_feeds & self.log['final_feeds'])
+        self.log['final_feeds'] |= new_feeds
         ###检查poi###
         pois_to_evaluate = []
         search_res_clean=self._clean_keys(search_res)
+        # 已有POI名称的小写形式只计算一次（本循环中 final_res 只会删除元素，与之同步删除）
+        existed_names=[existed_poi['POI名称'].lower() for existed_poi in self.log['final_res']]
+        # 小写名称 -> 第一个同名的已有POI：与已有POI同名是最常见的重复情况，可以直接定位
+        existed_by_name=dict()
+        for existed_poi,existed_name in zip(self.log['final_res'],existed_names):
+            existed_by_name.setdefault(existed_name,existed_poi)
         for poi_info in search_res_clean:
-            flag=0
-            for existed_poi in self.log['final_res']:
-                if existed_poi['POI名称'].lower() in poi_info['POI名称'].lower():
-                    ###如果已有poi中包含该新poi，则直接合并
-                    existed_related_pois+=1
-                    existed_poi['好评内容'].extend(poi_info['好评内容'])
-                    existed_poi['差评内容'].extend(poi_info['差评内容'])
-                    new_comments=new_comments+len(poi_info['好评内容'])+len(poi_info['差评内容'])
-                    poi_info['是否匹配']=existed_poi['是否匹配']
-                    poi_info['判断理由']=existed_poi['判断理由']
-                    flag=1
-                    break
-                elif poi_info['POI名称'].lower() in existed_poi['POI名称'].lower():
-                    ###如果新poi中包含该已有poi，则把已有poi的信息合并到新poi，移除已有poi，重新评估新poi
-                    existed_related_pois+=1
-                    # 把 existed_poi 的评论合并到 poi_info
-                    poi_info['好评内容'].extend(existed_poi['好评内容'])
-                    poi_info['差评内容'].extend(existed_poi['差评内容'])
-                    new_comments=new_comments+len(poi_info['好评内容'])+len(poi_info['差评内容'])
-                    # 从 final_res 中移除 existed_poi
-                    self.log['final_res'].remove(existed_poi)
-                    # 评估 poi_info 而不是 existed_poi
-                    pois_to_evaluate.append(poi_info)
-                    flag=1
-                    break
-            if flag == 0:
+            poi_name=poi_info['POI名称'].lower()
+            existed_poi=existed_by_name.get(poi_name)
+            remove_idx=None
+            if existed_poi is None:
+                # 没有同名POI时再逐个检查名称包含关系
+                for idx,existed_name in enumerate(existed_names):
+                    if existed_name in poi_name:
+                        existed_poi=self.log['final_res'][idx]
+                        break
+                    elif poi_name in existed_name:
+                        existed_poi=self.log['final_res'][idx]
+                        remove_idx=idx
+                        break
+            if existed_poi is None:
+                pois_to_evaluate.append(poi_info)
+            elif remove_idx is None:
+                ###如果已有poi中包含该新poi，则直接合并
+                existed_related_pois+=1
+                _merge_comments(existed_poi['好评内容'], poi_info['好评内容'])
+                _merge_comments(existed_poi['差评内容'], poi_info['差评内容'])
+                new_comments=new_comments+len(poi_info['好评内容'])+len(poi_info['差评内容'])
+                poi_info['是否匹配']=existed_poi['是否匹配']
+                poi_info['判断理由']=existed_poi['判断理由']
+            else:
+                ###如果新poi中包含该已有poi，则把已有poi的信息合并到新poi，移除已有poi，重新评估新poi
+                existed_related_pois+=1
+                # 把 existed_poi 的评论合并到 poi_info
+                _merge_comments(poi_info['好评内容'], existed_poi['好评内容'])
+                _merge_comments(poi_info['差评内容'], existed_poi['差评内容'])
+                new_comments=new_comments+len(poi_info['好评内容'])+len(poi_info['差评内容'])
+                # 从 final_res 中移除 existed_poi
+                del self.log['final_res'][remove_idx]
+                removed_name=existed_names.pop(remove_idx)
+                if existed_by_name.get(removed_name) is existed_poi:
+                    # 同名索引改为指向下一个同名的已有POI（没有则删除）
+                    del existed_by_name[removed_name]
+                    for other_poi,other_name in zip(self.log['final_res'],existed_names):
+                        if other_name==removed_name:
+                            existed_by_name[removed_name]=other_poi
+                            break
+                # 评估 poi_info 而不是 existed_poi
                 pois_to_evaluate.append(poi_info)
         if pois_to_evaluate:
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                # 提交所有评估任务
-                future_to_poi = {executor.submit(self.match_eval, poi_info): poi_info 
-                                for poi_info in pois_to_evaluate}
-                # 获取评估结果
-                for future in as_completed(future_to_poi):
-                    poi_info = future_to_poi[future]
-                    try:
-                        match = future.result()
-                        poi_info['是否匹配'] = match['是否匹配']
-                        poi_info['判断理由'] = match['判断理由']
-                        if poi_info['是否匹配'] == "是":
-                            poi_info['好评内容']=list(set(poi_info['好评内容']))
-                            poi_info['差评内容']=list(set(poi_info['差评内容']))
-                            if poi_info not in self.log['final_res']:
-                                new_realted_pois += 1
-                                self.log['final_res'].append(poi_info)
-                                new_comments=new_comments+len(poi_info['好评内容'])+len(poi_info['差评内容'])
+            # 按内容长度排序后再分批，长度相近的POI放在同一批，避免一批的耗时被其中最长的POI拖慢
+            pois_by_size = sorted(pois_to_evaluate, key=_poi_text_size)
+            # 按批提交评估任务（共用模块级线程池，不用每个步骤都重新创建线程）
+            future_to_batch = {_MATCH_EVAL_POOL.submit(self.match_eval_batch, batch): batch
+                               for batch in (pois_by_size[i:i+MATCH_EVAL_BATCH_SIZE]
+                                             for i in range(0, len(pois_by_size), MATCH_EVAL_BATCH_SIZE))}
+            # 按名称索引 final_res：相等的字典名称必然相同，查重时只需和同名的POI比较
+            final_res_by_name=dict()
+            for existed_poi in self.log['final_res']:
+                final_res_by_name.setdefault(existed_poi['POI名称'],[]).append(existed_poi)
+            match_by_poi = dict()  # id(poi_info) -> 评估结果
+            for future, batch in future_to_batch.items():
+                for poi_info, match in zip(batch, future.result()):
+                    match_by_poi[id(poi_info)] = match
+            # 按原顺序应用评估结果，final_res 的顺序不受分批方式和完成先后的影响
+            for poi_info in pois_to_evaluate:
+                match = match_by_poi[id(poi_info)]
+                try:
+                    poi_info['是否匹配'] = match['是否匹配']
+                    poi_info['判断理由'] = match['判断理由']
+                    if poi_info['是否匹配'] == "是":
+                        same_name=final_res_by_name.setdefault(poi_info['POI名称'],[])
+                        if poi_info not in same_name:
+                            new_realted_pois += 1
+                            self.log['final_res'].append(poi_info)
+                            same_name.append(poi_info)
+                            new_comments=new_comments+len(poi_info['好评内容'])+len(poi_info['差评内容'])
+                    else:
+                        same_name=final_res_by_name.get(poi_info['POI名称'],[])
+                        if poi_info in same_name:
+                            same_name.remove(poi_info)
+                            self.log['final_res'].remove(poi_info)
                         else:
-                            if poi_info in self.log['final_res']:
-                                self.log['final_res'].remove(poi_info)
-                            else:
-                                new_unrelated_pois += 1
-                    except Exception as e:
-                        print(f"评估POI时出错: {e}")
-                        poi_info['是否匹配'] = "不确定"
-                        poi_info['判断理由'] = "评估是API执行出错，按照不确定处理"
-                        new_unrelated_pois += 1
+                            new_unrelated_pois += 1
+                except Exception as e:
+                    print(f"评估POI时出错: {e}")
+                    poi_info['是否匹配'] = "不确定"
+                    poi_info['判断理由'] = "评估是API执行出错，按照不确定处理"
+                    new_unrelated_pois += 1
         ####总结内容写入####
         summary="本次搜索任务共搜索到%d个网页，其中%d个是之前已经搜索过的重复网页。新搜索到的网页中共发现%d个候选POI，其中%d个是之前被搜索到的POI,%d个是与用户请求相关的新候选POI，%d个被认为是与用户请求不相关的POI。共搜到%d个与已有或新增POI相关的评论。"%(total_feeds,existed_feeds,total_pois,existed_related_pois,new_realted_pois,new_unrelated_pois,new_comments)
         return summary,search_res_clean
     def add_searchlog(self,step):
         self.log['process'][str(step['行动步骤'])]=step
+    def match_eval_batch(self,poi_list):
+        """
+        评估多个POI，返回与 poi_list 顺序一致的结果
+
+        同一请求下名称和简介相同的POI直接复用之前的评估结果（修订执行时大部分POI会重复出现），
+        其余的POI合并为一次 LLM 调用评估
+        """
+        keys=[(poi_info['POI名称'],poi_info['POI简介']) for poi_info in poi_list]
+        results={key:self._eval_cache[key] for key in keys if key in self._eval_cache}
+        todo=[(poi_info,key) for poi_info,key in zip(poi_list,keys) if key not in results]
+        if todo:
+            matches=self._match_eval_llm([poi_info for poi_info,_ in todo])
+            for (poi_info,key),match in zip(todo,matches):
+                results[key]=match
+                # 只缓存明确的判断结果，出错或不确定的下次重新评估
+                if isinstance(match,dict) and match.get('是否匹配') in ('是','否'):
+                    self._eval_cache[key]=match
+        return [results[key] for key in keys]
+    def _match_eval_llm(self,poi_list):
+        """一次调用评估多个POI，返回与 poi_list 顺序一致的结果；批量结果无法解析时退回逐个评估"""
+        if len(poi_list)>1:
+            prompt=agent_match_prompt_batch(self.log['query'],poi_list)
+            try:
+                match_res=self.llm.call_with_messages_small(prompt,temp=0)
+                matches=json.loads(extract_json_from_response(match_res))
+                if (isinstance(matches,list) and len(matches)==len(poi_list)
+                        and all(isinstance(m,dict) and '是否匹配' in m and '判断理由' in m for m in matches)):
+                    return matches
+                print(f"批量评估结果与 {len(poi_list)} 个POI不对应，改为逐个评估")
+            except Exception as e:
+                print(f"批量评估POI出错，改为逐个评估: {e}")
+        return [self.match_eval(poi_info) for poi_info in poi_list]
     def match_eval(self,poi_info):
-        prompt=agent_match_prompt(self.log['query'],poi_info)
+        prompt=self._match_prompt_header+agent_match_prompt_body(poi_info)
         try:
             match_res=self.llm.call_with_messages_small(prompt,temp=0)
             return json.loads(match_res)
@@ -175,51 +294,53 @@ class search_agent():
         return json.loads(clean_plan)
     def execution(self,plan):
         # 第一阶段：并行执行所有搜索任务（不打印中间结果）
-        search_results = {}  # step_index -> (search_res, feed_list, search_record, run_log)
         advice = "-最终将按照以下标准判断候选POI搜索结果的质量：1.搜索出来的尽量多的候选POI；2.每个候选POI都必须与用户的请求相关；3.对每个POI都有尽量多的多方面评价，既有好评又有差评。"
 
         print(f"开始并行搜索 {len(plan)} 个步骤...")
 
-        def run_search(step_index, step):
-            search_res, feed_list, search_record, run_log = self.poi_tool.run(
-                step['搜索请求'], advice=advice, verbose=False
-            )
-            return step_index, search_res, feed_list, search_record, run_log
+        def run_search(search_query):
+            return self.poi_tool.run(search_query, advice=advice, verbose=False)
 
         with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {executor.submit(run_search, i, step): i for i, step in enumerate(plan)}
-            for future in as_completed(futures):
-                step_index, search_res, feed_list, search_record, run_log = future.result()
-                search_results[step_index] = (search_res, feed_list, search_record, run_log)
-                print(f"  ✓ 步骤 {step_index + 1} 搜索完成，发现 {len(search_res)} 个候选POI")
-
-        print(f"\n所有搜索完成，开始汇总结果...")
-
-        # 第二阶段：按顺序汇总结果（保证 summary_step 的串行执行）
-        for i, step in enumerate(plan):
-            search_res, feed_list, search_record, run_log = search_results[i]
-            # 保存搜索日志
-            self.logger.log['search_logs'][str(step['行动步骤'])] = run_log
-            summary, match_res = self.logger.summary_step(search_res, feed_list)
-            step['执行总结'] = summary
-            step['执行结果'] = match_res
-            step['搜索过程'] = search_record + '\nPOI与用户请求匹配结果:\n' + str([item['POI名称']+",是否匹配:"+item['是否匹配'] for item in match_res])
-            step['本步骤搜索网页'] = feed_list
-            step['本步骤搜索POI'] = search_res
-            self.logger.add_searchlog(step)
-            # 打印汇总结果
-            print(f"  步骤 {i + 1}: {summary}")
+            # 搜索请求相同的步骤只搜索一次，共用同一个搜索结果
+            query_futures = {}
+            for step in plan:
+                if step['搜索请求'] not in query_futures:
+                    query_futures[step['搜索请求']] = executor.submit(run_search, step['搜索请求'])
+
+            # 第二阶段：按顺序汇总结果（保证 summary_step 的串行执行）
+            # 汇总在线程池运行期间进行，排在前面的步骤一搜索完就开始汇总，与其余步骤的搜索重叠
+            for i, step in enumerate(plan):
+                search_res, feed_list, search_record, run_log = query_futures[step['搜索请求']].result()
+                # 共用结果的步骤各自持有一份列表，步骤日志之间互不影响
+                search_res, feed_list = list(search_res), list(feed_list)
+                print(f"  ✓ 步骤 {i + 1} 搜索完成，发现 {len(search_res)} 个候选POI")
+                # 保存搜索日志
+                self.logger.log['search_logs'][str(step['行动步骤'])] = run_log
+                summary, match_res = self.logger.summary_step(search_res, feed_list)
+                step['执行总结'] = summary
+                step['执行结果'] = match_res
+                step['搜索过程'] = search_record + '\nPOI与用户请求匹配结果:\n' + _format_match_res(match_res)
+                step['本步骤搜索网页'] = feed_list
+                step['本步骤搜索POI'] = search_res
+                self.logger.add_searchlog(step)
+                # 打印汇总结果
+                print(f"  步骤 {i + 1}: {summary}")
 
         print(f"\n初始搜索完成，共找到 {len(self.logger.log['final_res'])} 个相关POI")
         return self.logger.log['final_res']
     def revise_execution(self,opt_steps):
         self.logger.log['final_res']=list()
-        self.logger.log['final_feeds']=list()
+        self.logger.log['final_feeds']=set()
         print("开始优化执行...")
         advice = "-最终将按照以下标准判断候选POI搜索结果的质量：1.搜索出来的尽量多的候选POI；2.每个候选POI都必须与用户的请求相关；3.对每个POI都有尽量多的多方面评价，既有好评又有差评。"
         # 统一 opt_steps 的键为字符串
         opt_steps_str = {str(k): v for k, v in opt_steps.items()}
         plan_steps = json.loads(self.logger.log['plan'])
+        # 写回 log['plan'] 的计划单独复制一份（plan_steps 中的步骤后面会被加入执行结果），循环结束后统一序列化一次
+        # 步骤中只会整体替换字段值，复制每个步骤的字典即可，不必再解析一次
+        cur_plan = [dict(step) for step in plan_steps]
+        plan_modified = False
 
         # 第一阶段：分类步骤并更新 plan
         steps_to_search = []  # 需要搜索的步骤 (step_key, search_query, case_type)
@@ -230,14 +351,16 @@ class search_agent():
             if step_key not in opt_steps_str and step_key in self.logger.log['process']:
                 # Case 1: 复用缓存
                 print(f"  步骤 {step_key}: 复用缓存结果")
+                # summary_step 只会原地扩展POI的评论列表，复制到列表一层即可；网页列表只读，搜索过程是字符串
+                step_log = self.logger.log['process'][step_key]
                 cached_results[step_key] = (
-                    copy.deepcopy(self.logger.log['process'][step_key]['本步骤搜索POI']),
-                    copy.deepcopy(self.logger.log['process'][step_key]['本步骤搜索网页']),
-                    self.logger.log['process'][step_key]['搜索过程']
+                    [{k: (list(v) if isinstance(v, list) else v) for k, v in poi.items()}
+                     for poi in step_log['本步骤搜索POI']],
+                    step_log['本步骤搜索网页'],
+                    step_log['搜索过程']
                 )
             elif step_key in opt_steps_str:
                 # Case 2: 需要优化搜索，先更新 plan
-                cur_plan = json.loads(self.logger.log['plan'])
                 for plan_step in cur_plan:
                     if str(plan_step['行动步骤']) == step_key:
                         plan_step['行动规划'] = opt_steps_str[step_key]['行动规划']
@@ -245,54 +368,53 @@ class search_agent():
                         step['行动规划'] = opt_steps_str[step_key]['行动规划']
                         step['搜索请求'] = opt_steps_str[step_key]['搜索请求']
                         break
-                self.logger.log['plan'] = json.dumps(cur_plan, ensure_ascii=False)
+                plan_modified = True
                 steps_to_search.append((step_key, opt_steps_str[step_key]['搜索请求'], 'optimize'))
             else:
                 # Case 3: 之前未执行，需要执行
                 steps_to_search.append((step_key, step['搜索请求'], 'new'))
 
-        # 第二阶段：并行执行需要搜索的步骤
-        search_results = {}  # step_key -> (search_res, feed_list, search_record, run_log)
-        if steps_to_search:
-            print(f"\n并行搜索 {len(steps_to_search)} 个步骤...")
+        if plan_modified:
+            self.logger.log['plan'] = json.dumps(cur_plan, ensure_ascii=False)
 
-            def run_search(step_key, search_query, case_type):
-                search_res, feed_list, search_record, run_log = self.poi_tool.run(
-                    search_query, advice=advice, verbose=False
-                )
-                return step_key, search_res, feed_list, search_record, run_log, case_type
-
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                futures = {
-                    executor.submit(run_search, step_key, query, case_type): step_key
-                    for step_key, query, case_type in steps_to_search
-                }
-                for future in as_completed(futures):
-                    step_key, search_res, feed_list, search_record, run_log, case_type = future.result()
-                    search_results[step_key] = (search_res, feed_list, search_record, run_log)
+        # 第二阶段：并行执行需要搜索的步骤；第三阶段：按顺序串行汇总结果
+        # 汇总在搜索线程池运行期间进行，排在前面的步骤一就绪就开始汇总，与其余步骤的搜索重叠
+        def run_search(search_query):
+            return self.poi_tool.run(search_query, advice=advice, verbose=False)
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            search_futures = {}  # step_key -> (future, case_type)
+            query_futures = {}   # 搜索请求 -> future，搜索请求相同的步骤只搜索一次
+            if steps_to_search:
+                print(f"\n并行搜索 {len(steps_to_search)} 个步骤...")
+                for step_key, query, case_type in steps_to_search:
+                    if query not in query_futures:
+                        query_futures[query] = executor.submit(run_search, query)
+                    search_futures[step_key] = (query_futures[query], case_type)
+
+            print(f"\n汇总结果...")
+            for step in plan_steps:
+                step_key = str(step["行动步骤"])
+                if step_key in cached_results:
+                    # Case 1: 使用缓存
+                    search_res, feed_list, search_record = cached_results[step_key]
+                else:
+                    # Case 2/3: 等待该步骤的搜索结果
+                    future, case_type = search_futures[step_key]
+                    search_res, feed_list, search_record, run_log = future.result()
+                    search_res, feed_list = list(search_res), list(feed_list)
                     case_desc = "优化搜索" if case_type == 'optimize' else "新执行"
                     print(f"  ✓ 步骤 {step_key} ({case_desc}) 完成，发现 {len(search_res)} 个候选POI")
+                    self.logger.log['search_logs'][step_key] = run_log
 
-        # 第三阶段：按顺序串行汇总结果
-        print(f"\n汇总结果...")
-        for step in plan_steps:
-            step_key = str(step["行动步骤"])
-            if step_key in cached_results:
-                # Case 1: 使用缓存
-                search_res, feed_list, search_record = cached_results[step_key]
-            else:
-                # Case 2/3: 使用搜索结果
-                search_res, feed_list, search_record, run_log = search_results[step_key]
-                self.logger.log['search_logs'][step_key] = run_log
-
-            summary, match_res = self.logger.summary_step(search_res, feed_list)
-            step['执行总结'] = summary
-            step['执行结果'] = match_res
-            step['搜索过程'] = search_record + '\nPOI与用户请求匹配结果:\n' + str([item['POI名称']+",是否匹配:"+item['是否匹配']+",理由:"+item['判断理由'] for item in match_res])
-            step['本步骤搜索网页'] = feed_list
-            step['本步骤搜索POI'] = search_res
-            self.logger.add_searchlog(step)
-            print(f"  步骤 {step_key}: {summary}")
+                summary, match_res = self.logger.summary_step(search_res, feed_list)
+                step['执行总结'] = summary
+                step['执行结果'] = match_res
+                step['搜索过程'] = search_record + '\nPOI与用户请求匹配结果:\n' + _format_match_res(match_res, with_reason=True)
+                step['本步骤搜索网页'] = feed_list
+                step['本步骤搜索POI'] = search_res
+                self.logger.add_searchlog(step)
+                print(f"  步骤 {step_key}: {summary}")
 
         print(f"\n优化执行完成，共找到 {len(self.logger.log['final_res'])} 个相关POI")
         return self.logger.log['final_res']
@@ -13,6 +13,8 @@ POI选择系统 - 通过二选一问答帮助用户筛选POI
 
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field, asdict
 from typing import Optional, Callable, Any
 from enum import Enum
@@ -37,9 +39,10 @@ class UserChoice(Enum):
     ASK_AGENT = "G"    # 【新增】向agent提问
     SHOW_POIS = "H"    # 【新增】显示当前所有POI
 
-@dataclass
+@dataclass(frozen=True)
 class POI:
-    """POI数据结构"""
+    """POI数据结构（不可变，使用 __slots__ 省去每个实例的 __dict__）"""
+    __slots__ = ("name", "description")
     name: str
     description: str
     
@@ -53,6 +56,10 @@ class POI:
     def from_dict(cls, data: dict) -> 'POI':
         return cls(name=data["name"], description=data["description"])
     
+    def __reduce__(self):
+        # frozen + __slots__ 时默认的 copy/pickle 会逐个 setattr，这里改为直接按字段重建
+        return (POI, (self.name, self.description))
+    
     def __hash__(self):
         return hash(self.name)
     
@@ -92,11 +99,26 @@ class ConversationLogger:
     """对话历史日志记录器"""
     user_request: str = ""
     qa_history: list[QARecord] = field(default_factory=list)
+    # get_history_prompt 的结果缓存，通过 add_record / pop_record / clear 修改记录时失效
+    _history_prompt_cache: Optional[str] = field(default=None, init=False, repr=False, compare=False)
     
     def add_record(self, record: QARecord):
         self.qa_history.append(record)
+        self._history_prompt_cache = None
+    
+    def pop_record(self) -> Optional[QARecord]:
+        """移除并返回最后一条记录，没有记录时返回 None"""
+        if not self.qa_history:
+            return None
+        self._history_prompt_cache = None
+        return self.qa_history.pop()
     
     def get_history_prompt(self) -> str:
+        if self._history_prompt_cache is None:
+            self._history_prompt_cache = self._build_history_prompt()
+        return self._history_prompt_cache
+    
+    def _build_history_prompt(self) -> str:
         if not self.qa_history:
             return """
 【历史问答记录】
@@ -144,6 +166,7 @@ class ConversationLogger:
     def clear(self):
         """清空历史记录"""
         self.qa_history = []
+        self._history_prompt_cache = None
 
 
 @dataclass
@@ -174,21 +197,40 @@ class DecisionNode:
         }
     
     @classmethod
-    def from_dict(cls, data: dict) -> 'DecisionNode':
-        """从字典重建节点"""
+    def from_dict(cls, data: dict, poi_pool: Optional[dict] = None) -> 'DecisionNode':
+        """
+        从字典重建节点
+
+        Args:
+            data: 节点字典
+            poi_pool: 可选的 {(名称, 简介): POI} 共享池，整棵树中相同的POI只创建一个实例
+        """
+        if poi_pool is None:
+            poi_pool = {}
+
+        def to_pois(items: list[dict]) -> list[POI]:
+            pois = []
+            for p in items:
+                key = (p["name"], p["description"])
+                poi = poi_pool.get(key)
+                if poi is None:
+                    poi = poi_pool[key] = POI.from_dict(p)
+                pois.append(poi)
+            return pois
+
         node = cls(
             question=data["question"],
             option_a=data["option_a"],
             option_b=data["option_b"],
-            current_pois=[POI.from_dict(p) for p in data["current_pois"]],
-            pois_if_a=[POI.from_dict(p) for p in data["pois_if_a"]],
-            pois_if_b=[POI.from_dict(p) for p in data["pois_if_b"]],
+            current_pois=to_pois(data["current_pois"]),
+            pois_if_a=to_pois(data["pois_if_a"]),
+            pois_if_b=to_pois(data["pois_if_b"]),
             depth=data["depth"]
         )
         if data["child_a"]:
-            node.child_a = cls.from_dict(data["child_a"])
+            node.child_a = cls.from_dict(data["child_a"], poi_pool)
         if data["child_b"]:
-            node.child_b = cls.from_dict(data["child_b"])
+            node.child_b = cls.from_dict(data["child_b"], poi_pool)
         return node
 
 
@@ -214,21 +256,285 @@ class DecisionTreeData:
     
     @classmethod
     def from_dict(cls, data: dict) -> 'DecisionTreeData':
+        # 各节点的POI列表与全量POI共用同一批实例，加载大决策树时不会为每个节点重复创建POI
+        poi_pool = {}
+        pois = []
+        for p in data["pois"]:
+            key = (p["name"], p["description"])
+            if key not in poi_pool:
+                poi_pool[key] = POI.from_dict(p)
+            pois.append(poi_pool[key])
         return cls(
             user_request=data["user_request"],
-            pois=[POI.from_dict(p) for p in data["pois"]],
-            root=DecisionNode.from_dict(data["root"]) if data["root"] else None,
+            pois=pois,
+            root=DecisionNode.from_dict(data["root"], poi_pool) if data["root"] else None,
             created_at=data["created_at"],
             max_depth=data["max_depth"],
             min_pois_to_continue=data["min_pois_to_continue"]
         )
 
 
+# ============== POI筛选（构建器与交互选择器共用） ==============
+
+# 每次LLM调用合并判断的POI数量上限，避免单个提示词过长
+FILTER_BATCH_SIZE = 20
+# 同一次筛选中多个批次并行调用LLM的最大线程数
+# （实际同时进行的LLM调用数还受 DecisionTreeBuilder 的并发上限约束）
+FILTER_MAX_WORKERS = 4
+# LLM 返回的筛选结论；其他取值视为未得到有效判断
+FILTER_DECISIONS = {"保留": True, "过滤": False}
+
+
+def _map_batches(func: Callable[[list[POI]], list], pois: list[POI]) -> list[tuple[list[POI], list]]:
+    """把 pois 按 FILTER_BATCH_SIZE 分批，并行地对每批调用 func，按批次顺序返回 [(batch, result)]"""
+    batches = [pois[start:start + FILTER_BATCH_SIZE] for start in range(0, len(pois), FILTER_BATCH_SIZE)]
+    if len(batches) <= 1:
+        return [(batch, func(batch)) for batch in batches]
+    with ThreadPoolExecutor(max_workers=min(len(batches), FILTER_MAX_WORKERS)) as executor:
+        return list(zip(batches, executor.map(func, batches)))
+
+
+def _filter_context_prompt(user_request: str, history_prompt: str, question: str,
+                           option_a: str, option_b: str, choice: str, chosen_option: str) -> str:
+    """筛选提示词中与具体POI无关的部分"""
+    return f"""【用户原始请求】
+{user_request}
+
+{history_prompt}
+
+【当前问答轮次】
+问题: {question}
+选项A: {option_a}
+选项B: {option_b}
+用户选择: {choice} ({chosen_option})
+"""
+
+
+def _filter_single_poi(small_llm_api: Callable[[str], str], poi: POI, context: str,
+                       chosen_option: str) -> Optional[bool]:
+    """逐个判断单个POI是否保留（批量判断失败时使用）；调用失败或未得到有效结论时返回 None"""
+    prompt = f"""你是一个POI筛选助手，需要判断单个POI是否符合用户的选择条件。
+
+{context}
+【待判断的POI】
+名称: {poi.name}
+简介: {poi.description}
+
+【判断任务】
+请根据用户的选择，判断这个POI是否符合用户的偏好。
+- 如果这个POI符合用户选择的"{chosen_option}"这一偏好，返回"保留"
+- 如果这个POI不符合用户选择的偏好，返回"过滤"
+
+请以JSON格式返回，包含以下字段:
+- decision: "保留" 或 "过滤"
+- reason: 简短说明判断理由（一句话）
+
+只返回JSON，不要其他内容。
+"""
+    try:
+        response = small_llm_api(prompt)
+    except Exception as e:
+        print(f"[警告] 判断POI '{poi.name}' 时LLM调用失败: {e}")
+        return None
+    try:
+        result = json.loads(response)
+        return FILTER_DECISIONS.get(result.get("decision"))
+    except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+        print(f"[警告] 判断POI '{poi.name}' 时LLM响应解析失败: {e}")
+        return None
+
+
+def _filter_poi_batch(small_llm_api: Callable[[str], str], pois: list[POI], context: str,
+                      chosen_option: str) -> Optional[list[Optional[bool]]]:
+    """
+    一次调用判断一批POI是否保留，返回与 pois 顺序一致的结果
+
+    调用失败或响应无法解析时返回 None；单个POI未给出有效结论时对应位置为 None。
+    """
+    poi_text = "\n".join(
+        f"[{i}] 名称: {poi.name}\n    简介: {poi.description}" for i, poi in enumerate(pois, 1)
+    )
+    prompt = f"""你是一个POI筛选助手，需要逐个判断以下每个POI是否符合用户的选择条件。
+
+{context}
+【待判断的POI列表】
+共{len(pois)}个POI，用方括号中的编号标识：
+{poi_text}
+
+【判断任务】
+请根据用户的选择，逐个判断每个POI是否符合用户的偏好。
+- 如果POI符合用户选择的"{chosen_option}"这一偏好，decision返回"保留"
+- 如果POI不符合用户选择的偏好，decision返回"过滤"
+
+请以JSON数组格式返回，每个POI对应一个元素，包含以下字段:
+- index: POI的编号（整数）
+- decision: "保留" 或 "过滤"
+
+只返回JSON数组，不要其他内容。
+"""
+    try:
+        response = small_llm_api(prompt)
+    except Exception as e:
+        print(f"[警告] 批量判断{len(pois)}个POI时LLM调用失败: {e}")
+        return None
+    try:
+        results = json.loads(response)
+        decisions = {int(item["index"]): FILTER_DECISIONS.get(item.get("decision")) for item in results}
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError) as e:
+        print(f"[警告] 批量判断{len(pois)}个POI时LLM响应解析失败: {e}")
+        return None
+    if not all(i in decisions for i in range(1, len(pois) + 1)):
+        print(f"[警告] 批量判断结果与{len(pois)}个POI不对应")
+        return None
+    return [decisions[i] for i in range(1, len(pois) + 1)]
+
+
+def _judge_poi_batch(small_llm_api: Callable[[str], str], pois: list[POI], context: str,
+                     chosen_option: str) -> list[Optional[bool]]:
+    """判断一批POI是否保留，批量结果无法解析时退回逐个判断；未得到有效结论的POI为 None"""
+    keeps = _filter_poi_batch(small_llm_api, pois, context, chosen_option)
+    if keeps is None:
+        keeps = [_filter_single_poi(small_llm_api, poi, context, chosen_option) for poi in pois]
+    return keeps
+
+
+def _filter_pois(
+    small_llm_api: Callable[[str], str],
+    pois: list[POI],
+    user_request: str,
+    history_prompt: str,
+    question: str,
+    option_a: str,
+    option_b: str,
+    choice: str
+) -> list[POI]:
+    """
+    根据用户的选择筛选POI，每 FILTER_BATCH_SIZE 个POI合并为一次LLM调用
+
+    批量结果无法解析时，该批POI退回逐个判断；仍未得到有效结论的POI予以保留。允许返回空列表。
+    """
+    chosen_option = option_a if choice == "A" else option_b
+    context = _filter_context_prompt(user_request, history_prompt, question,
+                                     option_a, option_b, choice, chosen_option)
+
+    def judge(batch: list[POI]) -> list[Optional[bool]]:
+        return _judge_poi_batch(small_llm_api, batch, context, chosen_option)
+
+    filtered_pois = []
+    for batch, keeps in _map_batches(judge, pois):
+        filtered_pois.extend(poi for poi, keep in zip(batch, keeps) if keep is not False)
+    return filtered_pois
+
+
+
+def _filter_poi_batch_dual(small_llm_api: Callable[[str], str], pois: list[POI], user_request: str,
+                           history_prompt: str, question: str, option_a: str,
+                           option_b: str) -> Optional[list[tuple[Optional[bool], Optional[bool]]]]:
+    """
+    一次调用同时判断一批POI在选A、选B两种情况下是否保留
+
+    调用失败或响应无法解析时返回 None；某一选项未给出有效结论时对应位置为 None。
+    """
+    poi_text = "\n".join(
+        f"[{i}] 名称: {poi.name}\n    简介: {poi.description}" for i, poi in enumerate(pois, 1)
+    )
+    prompt = f"""你是一个POI筛选助手，需要逐个判断以下每个POI分别是否符合两个选项的条件。
+
+【用户原始请求】
+{user_request}
+
+{history_prompt}
+
+【当前问答轮次】
+问题: {question}
+选项A: {option_a}
+选项B: {option_b}
+
+【待判断的POI列表】
+共{len(pois)}个POI，用方括号中的编号标识：
+{poi_text}
+
+【判断任务】
+请分别假设用户选择了A、选择了B，逐个判断每个POI是否符合用户的偏好。
+- decision_a: 如果POI符合选项A"{option_a}"这一偏好，返回"保留"，否则返回"过滤"
+- decision_b: 如果POI符合选项B"{option_b}"这一偏好，返回"保留"，否则返回"过滤"
+
+请以JSON数组格式返回，每个POI对应一个元素，包含以下字段:
+- index: POI的编号（整数）
+- decision_a: "保留" 或 "过滤"
+- decision_b: "保留" 或 "过滤"
+
+只返回JSON数组，不要其他内容。
+"""
+    try:
+        response = small_llm_api(prompt)
+    except Exception as e:
+        print(f"[警告] 批量判断{len(pois)}个POI时LLM调用失败: {e}")
+        return None
+    try:
+        results = json.loads(response)
+        decisions = {
+            int(item["index"]): (FILTER_DECISIONS.get(item.get("decision_a")),
+                                 FILTER_DECISIONS.get(item.get("decision_b")))
+            for item in results
+        }
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError) as e:
+        print(f"[警告] 批量判断{len(pois)}个POI时LLM响应解析失败: {e}")
+        return None
+    if not all(i in decisions for i in range(1, len(pois) + 1)):
+        print(f"[警告] 批量判断结果与{len(pois)}个POI不对应")
+        return None
+    return [decisions[i] for i in range(1, len(pois) + 1)]
+
+
+def _filter_pois_dual(
+    small_llm_api: Callable[[str], str],
+    pois: list[POI],
+    user_request: str,
+    history_prompt: str,
+    question: str,
+    option_a: str,
+    option_b: str
+) -> tuple[list[POI], list[POI], list[POI]]:
+    """
+    同时得到选A、选B两种情况下的筛选结果，两个选项共用一次LLM调用
+
+    批量结果无法解析时，该批POI退回按A、B分别筛选；仍未得到有效结论的POI予以保留。
+    返回 (pois_if_a, pois_if_b, decided)，decided 为两个选项都得到有效结论的POI，
+    只有这些结果适合缓存。
+    """
+    context_a = _filter_context_prompt(user_request, history_prompt, question, option_a, option_b, "A", option_a)
+    context_b = _filter_context_prompt(user_request, history_prompt, question, option_a, option_b, "B", option_b)
+
+    def judge(batch: list[POI]) -> list[tuple[Optional[bool], Optional[bool]]]:
+        keeps = _filter_poi_batch_dual(small_llm_api, batch, user_request, history_prompt,
+                                       question, option_a, option_b)
+        if keeps is None:
+            keeps = list(zip(_judge_poi_batch(small_llm_api, batch, context_a, option_a),
+                             _judge_poi_batch(small_llm_api, batch, context_b, option_b)))
+        return keeps
+
+    pois_if_a, pois_if_b, decided = [], [], []
+    for batch, keeps in _map_batches(judge, pois):
+        for poi, (keep_a, keep_b) in zip(batch, keeps):
+            if keep_a is not False:
+                pois_if_a.append(poi)
+            if keep_b is not False:
+                pois_if_b.append(poi)
+            if keep_a is not None and keep_b is not None:
+                decided.append(poi)
+    return pois_if_a, pois_if_b, decided
+
 # ============== 决策树构建器（与交互分离） ==============
 
 class DecisionTreeBuilder:
     """【新增】决策树构建器 - 负责构建决策树，与用户交互分离"""
     
+    # 同一构建器同时进行的LLM调用数上限（按服务商的并发限制设置），所有分支和筛选批次共用
+    MAX_CONCURRENT_LLM_CALLS = 8
+    # 深度小于该值的节点才并行构建两个子分支，同时构建的子树最多 2**PARALLEL_BRANCH_DEPTH 个
+    PARALLEL_BRANCH_DEPTH = 3
+    
     def __init__(
         self,
         large_llm_api: Callable[[str], str],
@@ -241,11 +547,31 @@ class DecisionTreeBuilder:
         self.max_depth = max_depth
         self.min_pois_to_continue = min_pois_to_continue
         self.logger = ConversationLogger()
+        # 筛选结果缓存：(用户请求, 历史问答, 问题, 选项A, 选项B, POI名称, POI简介) -> (选A时保留, 选B时保留)
+        # 重试生成出相同的问题、换题重建子树时，已判断过的POI不再调用LLM
+        self._filter_cache: dict[tuple, tuple[bool, bool]] = {}
+        self._llm_semaphore = threading.BoundedSemaphore(self.MAX_CONCURRENT_LLM_CALLS)
+    
+    def _call_large_llm(self, prompt: str, **kwargs) -> str:
+        """受并发上限约束地调用大参数LLM"""
+        with self._llm_semaphore:
+            return self.large_llm_api(prompt, **kwargs)
+    
+    def _call_small_llm(self, prompt: str) -> str:
+        """受并发上限约束地调用小参数LLM"""
+        with self._llm_semaphore:
+            return self.small_llm_api(prompt)
     
     def _format_poi_list(self, pois: list[POI]) -> str:
         return "\n".join([f"- {poi.to_string()}" for poi in pois])
     
-    def _generate_question(self, pois: list[POI], depth: int, base_temp: float = 0.0) -> tuple[str, str, str]:
+    def _generate_question(
+        self,
+        pois: list[POI],
+        depth: int,
+        base_temp: float = 0.0,
+        logger: Optional[ConversationLogger] = None
+    ) -> tuple[str, str, str]:
         """
         生成二选一问题
 
@@ -253,16 +579,18 @@ class DecisionTreeBuilder:
             pois: 当前POI列表
             depth: 当前深度
             base_temp: 基础temperature，用于控制生成多样性
+            logger: 该节点所在分支的对话历史，默认使用 self.logger
 
         Returns:
             (question, option_a, option_b) 元组
         """
+        logger = logger or self.logger
         prompt = f"""你是一个帮助用户选择地点(POI)的助手，需要通过提问来帮助用户缩小选择范围。
 
 【用户原始请求】
-{self.logger.user_request}
+{logger.user_request}
 
-{self.logger.get_history_prompt()}
+{logger.get_history_prompt()}
 
 【当前待筛选的POI列表】
 说明：以下是目前还在候选范围内的POI，共{len(pois)}个。
@@ -290,7 +618,7 @@ class DecisionTreeBuilder:
         for i in range(3):
             try:
                 temp = base_temp + i * 0.2
-                response = self.large_llm_api(prompt, temp=temp)
+                response = self._call_large_llm(prompt, temp=temp)
                 result = json.loads(response)
                 question = result["question"]
                 option_a = result["option_a"]
@@ -300,70 +628,69 @@ class DecisionTreeBuilder:
                 print(f"[警告] LLM响应解析失败: {e},重新尝试{i+1}次生成...")
         return "您有什么特别的偏好吗？", "是的，有特定要求", "没有，都可以"
     
-    def _filter_pois_by_choice(
-        self, 
-        pois: list[POI], 
-        question: str, 
-        option_a: str, 
-        option_b: str, 
-        choice: str
-    ) -> list[POI]:
-        chosen_option = option_a if choice == "A" else option_b
-        filtered_pois = []
-        
-        for poi in pois:
-            prompt = f"""你是一个POI筛选助手，需要判断单个POI是否符合用户的选择条件。
-
-【用户原始请求】
-{self.logger.user_request}
-
-{self.logger.get_history_prompt()}
-
-【当前问答轮次】
-问题: {question}
-选项A: {option_a}
-选项B: {option_b}
-用户选择: {choice} ({chosen_option})
-
-【待判断的POI】
-名称: {poi.name}
-简介: {poi.description}
-
-【判断任务】
-请根据用户的选择，判断这个POI是否符合用户的偏好。
-- 如果这个POI符合用户选择的"{chosen_option}"这一偏好，返回"保留"
-- 如果这个POI不符合用户选择的偏好，返回"过滤"
-
-请以JSON格式返回，包含以下字段:
-- decision: "保留" 或 "过滤"
-- reason: 简短说明判断理由（一句话）
+    def _filter_pois_dual(
+        self,
+        pois: list[POI],
+        question: str,
+        option_a: str,
+        option_b: str,
+        logger: Optional[ConversationLogger] = None
+    ) -> tuple[list[POI], list[POI]]:
+        """
+        一次筛选同时得到 (pois_if_a, pois_if_b)，允许返回空列表
 
-只返回JSON，不要其他内容。
-"""
-            
-            response = self.small_llm_api(prompt)
-            try:
-                result = json.loads(response)
-                decision = result.get("decision", "保留")
-                if decision == "保留":
-                    filtered_pois.append(poi)
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"[警告] 判断POI '{poi.name}' 时LLM响应解析失败: {e}")
-                filtered_pois.append(poi)
-
-        # 允许返回空列表，不再保留第一个POI作为兜底
-        return filtered_pois
+        已判断过的POI直接使用缓存结果；LLM未给出有效结论而默认保留的POI不写入缓存，下次重新判断。
+        """
+        logger = logger or self.logger
+        history_prompt = logger.get_history_prompt()
+        context_key = (logger.user_request, history_prompt, question, option_a, option_b)
+        # 未缓存的POI按 (名称, 简介) 去重，重复出现的POI只判断一次
+        uncached = list({
+            (poi.name, poi.description): poi for poi in pois
+            if context_key + (poi.name, poi.description) not in self._filter_cache
+        }.values())
+        # 本次新判断的结果（含未得到有效结论的POI），只有有效结论会写入缓存
+        results = {}
+        if uncached:
+            new_a, new_b, decided = _filter_pois_dual(self._call_small_llm, uncached, logger.user_request,
+                                                      history_prompt, question, option_a, option_b)
+            # POI 按名称判等，这里按对象区分同名POI
+            kept_a, kept_b = {id(poi) for poi in new_a}, {id(poi) for poi in new_b}
+            decided_ids = {id(poi) for poi in decided}
+            for poi in uncached:
+                key = context_key + (poi.name, poi.description)
+                results[key] = (id(poi) in kept_a, id(poi) in kept_b)
+                if id(poi) in decided_ids:
+                    self._filter_cache[key] = results[key]
+        keys = [context_key + (poi.name, poi.description) for poi in pois]
+        keeps = [results[key] if key in results else self._filter_cache[key] for key in keys]
+        pois_if_a = [poi for poi, (keep_a, _) in zip(pois, keeps) if keep_a]
+        pois_if_b = [poi for poi, (_, keep_b) in zip(pois, keeps) if keep_b]
+        return pois_if_a, pois_if_b
     
     def _build_subtree(self, pois: list[POI], depth: int) -> Optional[DecisionNode]:
+        return self._build_subtree_with_logger(pois, depth, self.logger)
+
+    def _build_subtree_with_logger(
+        self,
+        pois: list[POI],
+        depth: int,
+        logger: ConversationLogger
+    ) -> Optional[DecisionNode]:
+        """
+        构建以当前POI列表为根的子树
+
+        logger 是该分支的对话历史，只读不改；两个子分支各自持有追加了本轮选择的副本，
+        因此可以并行构建而不互相影响。
+        """
         if depth >= self.max_depth:
             return None
         if len(pois) <= self.min_pois_to_continue:
             return None
 
         # 第一次生成问题并筛选
-        question, option_a, option_b = self._generate_question(pois, depth, base_temp=0.0)
-        pois_if_a = self._filter_pois_by_choice(pois, question, option_a, option_b, "A")
-        pois_if_b = self._filter_pois_by_choice(pois, question, option_a, option_b, "B")
+        question, option_a, option_b = self._generate_question(pois, depth, base_temp=0.0, logger=logger)
+        pois_if_a, pois_if_b = self._filter_pois_dual(pois, question, option_a, option_b, logger=logger)
 
         # 检查是否有空集合
         has_empty = len(pois_if_a) == 0 or len(pois_if_b) == 0
@@ -381,9 +708,8 @@ class DecisionTreeBuilder:
                 base_temp = retry * 0.3  # 0.3, 0.6
                 print(f"[警告] 问题生成导致空集合，正在重试 ({retry + 1}/{max_retries})，提高temperature以增加多样性...")
 
-                question, option_a, option_b = self._generate_question(pois, depth, base_temp)
-                pois_if_a = self._filter_pois_by_choice(pois, question, option_a, option_b, "A")
-                pois_if_b = self._filter_pois_by_choice(pois, question, option_a, option_b, "B")
+                question, option_a, option_b = self._generate_question(pois, depth, base_temp, logger=logger)
+                pois_if_a, pois_if_b = self._filter_pois_dual(pois, question, option_a, option_b, logger=logger)
 
                 # 检查是否还有空集合
                 has_empty = len(pois_if_a) == 0 or len(pois_if_b) == 0
@@ -405,25 +731,37 @@ class DecisionTreeBuilder:
             depth=depth
         )
 
-        temp_record_a = QARecord(question, option_a, option_b, "A")
-        self.logger.add_record(temp_record_a)
-
-        # 只有当选项A对应的POI数量大于阈值时才递归构建子树
-        if len(node.pois_if_a) > self.min_pois_to_continue:
-            node.child_a = self._build_subtree(node.pois_if_a, depth + 1)
-
-        self.logger.qa_history.pop()
-        temp_record_b = QARecord(question, option_a, option_b, "B")
-        self.logger.add_record(temp_record_b)
-
-        # 只有当选项B对应的POI数量大于阈值时才递归构建子树
-        if len(node.pois_if_b) > self.min_pois_to_continue:
-            node.child_b = self._build_subtree(node.pois_if_b, depth + 1)
-
-        self.logger.qa_history.pop()
+        # 两个子分支互不依赖（LLM调用为网络IO）：较浅的节点B分支在新线程中构建，A分支在当前线程构建
+        def branch_logger(choice: str) -> ConversationLogger:
+            return ConversationLogger(
+                user_request=logger.user_request,
+                qa_history=logger.qa_history + [QARecord(question, option_a, option_b, choice)]
+            )
+
+        # 只有当选项对应的POI数量大于阈值时才递归构建子树
+        build_a = len(node.pois_if_a) > self.min_pois_to_continue
+        build_b = len(node.pois_if_b) > self.min_pois_to_continue
+        if build_a and build_b and depth < self.PARALLEL_BRANCH_DEPTH:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future_b = executor.submit(self._build_child, node.pois_if_b, depth + 1, branch_logger("B"))
+                node.child_a = self._build_child(node.pois_if_a, depth + 1, branch_logger("A"))
+                node.child_b = future_b.result()
+        else:
+            if build_a:
+                node.child_a = self._build_child(node.pois_if_a, depth + 1, branch_logger("A"))
+            if build_b:
+                node.child_b = self._build_child(node.pois_if_b, depth + 1, branch_logger("B"))
 
         return node
     
+    def _build_child(self, pois: list[POI], depth: int, logger: ConversationLogger) -> Optional[DecisionNode]:
+        """构建子分支；出错时该分支作为叶节点，不影响已构建的其余部分"""
+        try:
+            return self._build_subtree_with_logger(pois, depth, logger)
+        except Exception as e:
+            print(f"[警告] 构建第{depth}层子树失败，该分支作为叶节点: {e}")
+            return None
+    
     def build(self, pois: list[POI], user_request: str) -> DecisionTreeData:
         """
         构建决策树并返回完整数据对象
@@ -460,10 +798,41 @@ class DecisionTreeStorage:
     """【新增】决策树存储管理器 - 负责保存和加载决策树"""
     
     DEFAULT_SAVE_DIR = "./data/decision_trees"
+    # 读写缓冲区大小（128 KiB），大决策树 json.dump 时可显著减少 write 系统调用次数
+    IO_BUFFER_SIZE = 1 << 17
+    # 决策树头信息索引文件，列出已保存的决策树时不必逐个解析完整的决策树文件
+    INDEX_FILENAME = "_index.json"
     
     def __init__(self, save_dir: str = None):
         self.save_dir = save_dir or self.DEFAULT_SAVE_DIR
         os.makedirs(self.save_dir, exist_ok=True)
+        self._index_path = os.path.join(self.save_dir, self.INDEX_FILENAME)
+    
+    def _load_index(self) -> dict:
+        """读取索引 {文件名: 头信息}，索引不存在或损坏时返回空字典（会在列出时重建）"""
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            return index if isinstance(index, dict) else {}
+        except (OSError, json.JSONDecodeError):
+            return {}
+    
+    def _write_index(self, index: dict):
+        """先写临时文件再替换，避免写到一半时索引文件损坏"""
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._index_path)
+    
+    @staticmethod
+    def _tree_header(data: dict, mtime: float) -> dict:
+        """从决策树数据中提取列表展示用的头信息，mtime 用于判断索引是否过期"""
+        return {
+            "user_request": data.get("user_request", "未知"),
+            "created_at": data.get("created_at", "未知"),
+            "poi_count": len(data.get("pois", [])),
+            "mtime": mtime
+        }
     
     def _generate_filename(self, user_request: str) -> str:
         """根据用户请求和时间生成文件名"""
@@ -489,8 +858,17 @@ class DecisionTreeStorage:
         
         filepath = os.path.join(self.save_dir, filename)
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(tree_data.to_dict(), f, ensure_ascii=False, indent=2)
+        data = tree_data.to_dict()
+        with open(filepath, 'w', encoding='utf-8', buffering=self.IO_BUFFER_SIZE) as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        
+        # 同步更新索引中该文件的头信息
+        try:
+            index = self._load_index()
+            index[filename] = self._tree_header(data, os.path.getmtime(filepath))
+            self._write_index(index)
+        except OSError as e:
+            print(f"[警告] 更新决策树索引失败: {e}")
         
         print(f"决策树已保存到: {filepath}")
         return filepath
@@ -505,7 +883,7 @@ class DecisionTreeStorage:
         Returns:
             DecisionTreeData: 加载的决策树数据
         """
-        with open(filepath, 'r', encoding='utf-8') as f:
+        with open(filepath, 'r', encoding='utf-8', buffering=self.IO_BUFFER_SIZE) as f:
             data = json.load(f)
         
         tree_data = DecisionTreeData.from_dict(data)
@@ -526,22 +904,37 @@ class DecisionTreeStorage:
         if not os.path.exists(self.save_dir):
             return trees
         
+        # 优先使用索引中的头信息；索引中没有或文件修改时间不一致（外部修改）时才解析文件
+        index = self._load_index()
+        new_index = {}
         for filename in os.listdir(self.save_dir):
-            if filename.endswith('.json'):
+            if filename.endswith('.json') and filename != self.INDEX_FILENAME:
                 filepath = os.path.join(self.save_dir, filename)
                 try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
+                    mtime = os.path.getmtime(filepath)
+                    header = index.get(filename)
+                    if header is None or header.get("mtime") != mtime:
+                        with open(filepath, 'r', encoding='utf-8', buffering=self.IO_BUFFER_SIZE) as f:
+                            data = json.load(f)
+                        header = self._tree_header(data, mtime)
+                    new_index[filename] = header
                     trees.append({
                         "filename": filename,
                         "filepath": filepath,
-                        "user_request": data.get("user_request", "未知"),
-                        "created_at": data.get("created_at", "未知"),
-                        "poi_count": len(data.get("pois", []))
+                        "user_request": header["user_request"],
+                        "created_at": header["created_at"],
+                        "poi_count": header["poi_count"]
                     })
                 except Exception as e:
                     print(f"[警告] 读取文件 {filename} 失败: {e}")
         
+        # 索引有变化（新增、过期或已删除的文件）时写回
+        if new_index != index:
+            try:
+                self._write_index(new_index)
+            except OSError as e:
+                print(f"[警告] 更新决策树索引失败: {e}")
+        
         # 按创建时间排序（最新的在前）
         trees.sort(key=lambda x: x["created_at"], reverse=True)
         return trees
@@ -588,8 +981,11 @@ class InteractiveSelector:
             max_depth=tree_data.max_depth,
             min_pois_to_continue=tree_data.min_pois_to_continue
         )
+        
+        # 运行环境在进程内不会变化，只探测一次
+        self._is_nb = self._compute_is_notebook()
     
-    def _is_notebook(self) -> bool:
+    def _compute_is_notebook(self) -> bool:
         try:
             from IPython import get_ipython
             ipy = get_ipython()
@@ -600,6 +996,9 @@ class InteractiveSelector:
         except (ImportError, NameError, AttributeError):
             return False
     
+    def _is_notebook(self) -> bool:
+        return self._is_nb
+    
     def _display_question(self, node: DecisionNode, can_go_back: bool = False):
         if self._is_notebook():
             self._display_question_notebook(node, can_go_back)
@@ -698,14 +1097,12 @@ class InteractiveSelector:
             </div>
             """
         else:
-            poi_items = ""
-            for i, poi in enumerate(pois, 1):
-                poi_items += f"""
+            poi_items = "".join(f"""
                 <div style="background-color: #fff; border: 1px solid #ddd; border-radius: 5px; padding: 10px; margin: 5px 0;">
                     <h4 style="margin: 0; color: #4CAF50;">{i}. {poi.name}</h4>
                     <p style="margin: 5px 0 0 0; color: #666;">{poi.description}</p>
                 </div>
-                """
+                """ for i, poi in enumerate(pois, 1))
             
             html_content = f"""
             <div style="border: 2px solid #4CAF50; border-radius: 10px; padding: 15px; margin: 10px 0; background-color: #f1f8e9;">
@@ -842,51 +1239,10 @@ class InteractiveSelector:
         Returns:
             筛选后的POI列表
         """
-        chosen_option = option_a if choice == "A" else option_b
-        filtered_pois = []
-        
-        for poi in pois:
-            prompt = f"""你是一个POI筛选助手，需要判断单个POI是否符合用户的选择条件。
-
-【用户原始请求】
-{self.tree_data.user_request}
-
-{self.logger.get_history_prompt()}
-
-【当前问答轮次】
-问题: {question}
-选项A: {option_a}
-选项B: {option_b}
-用户选择: {choice} ({chosen_option})
-
-【待判断的POI】
-名称: {poi.name}
-简介: {poi.description}
-
-【判断任务】
-请根据用户的选择，判断这个POI是否符合用户的偏好。
-- 如果这个POI符合用户选择的"{chosen_option}"这一偏好，返回"保留"
-- 如果这个POI不符合用户选择的偏好，返回"过滤"
-
-请以JSON格式返回，包含以下字段:
-- decision: "保留" 或 "过滤"
-- reason: 简短说明判断理由（一句话）
-
-只返回JSON，不要其他内容。
-"""
-            
-            response = self.small_llm_api(prompt)
-            try:
-                result = json.loads(response)
-                decision = result.get("decision", "保留")
-                if decision == "保留":
-                    filtered_pois.append(poi)
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"[警告] 判断POI '{poi.name}' 时LLM响应解析失败: {e}")
-                filtered_pois.append(poi)
-
         # 允许返回空列表，交互时会提示用户
-        return filtered_pois
+        # 通过构建器调用，与换题重建子树共用同一个LLM并发上限
+        return _filter_pois(self._tree_builder._call_small_llm, pois, self.tree_data.user_request,
+                           self.logger.get_history_prompt(), question, option_a, option_b, choice)
     
     def _save_tree_if_needed(self):
         """如果有storage和filepath，保存决策树"""
@@ -949,8 +1305,7 @@ class InteractiveSelector:
             elif choice == UserChoice.GO_BACK:
                 if history_stack:
                     prev_node, prev_pois, prev_record = history_stack.pop()
-                    if self.logger.qa_history:
-                        self.logger.qa_history.pop()
+                    self.logger.pop_record()
                     current_node = prev_node
                     current_pois = prev_pois
                     self._display_message("\n⬅️ 已回退到上一个问题", "warning")
@@ -2,6 +2,7 @@ from typing import List, Dict, Any, Callable, Optional
 from dataclasses import dataclass
 import json
 import requests
+from requests.adapters import HTTPAdapter
 from playwright.async_api import async_playwright
 import subprocess
 import tempfile
@@ -15,6 +16,10 @@ from src.core.basellm import base_llm
 from src.core.prompts import compress_web
 from config import BOCHA_API_KEY, BOCHA_API_URL
 
+# 模块级共享的搜索API会话，复用 keep-alive 连接（多个搜索步骤并行时共用连接池）
+_http_session = requests.Session()
+_http_session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
 # 全局日志记录器（用于整个会话）
 _session_logger: Optional[CrawlLogger] = None
 
@@ -146,7 +151,7 @@ def search_web(query: str, url_count = 5, crawl_logger: Optional[CrawlLogger] =
     }
 
     try:
-        response = requests.request("POST", url, headers=headers, data=payload, timeout=30)
+        response = _http_session.post(url, headers=headers, data=payload, timeout=30)
         response.raise_for_status()  # 检查 HTTP 状态码
         response_data = response.json()
     except requests.exceptions.RequestException as e:
@@ -0,0 +1,37 @@
+import json
+
+from src.search.searchagent import search_logger
+
+
+class FakeLLM:
+    """所有POI都判断为匹配"""
+
+    def call_with_messages_small(self, prompt, temp=0):
+        return json.dumps({'是否匹配': '是', '判断理由': 'ok'}, ensure_ascii=False)
+
+
+def test_summary_step_keeps_unhashable_comments():
+    logger = search_logger(FakeLLM(), '北京 烤鸭')
+    search_res = [{
+        'POI名称': '四季民福',
+        'POI简介': '烤鸭店',
+        '好评内容': ['好吃', {'内容': '环境好'}, '好吃', {'内容': '环境好'}],
+        '差评内容': [['排队', '久']],
+    }]
+    summary, res = logger.summary_step(search_res, ['u1'])
+
+    assert len(logger.log['final_res']) == 1
+    poi = logger.log['final_res'][0]
+    assert poi['是否匹配'] == '是'
+    assert poi['好评内容'] == ['好吃', {'内容': '环境好'}]
+    assert poi['差评内容'] == [['排队', '久']]
+
+    # 同名POI再次出现时合并评论，不可哈希的评论同样去重
+    logger.summary_step([{
+        'POI名称': '四季民福',
+        'POI简介': '烤鸭店',
+        '好评内容': [{'内容': '环境好'}, '服务热情'],
+        '差评内容': [['排队', '久']],
+    }], ['u2'])
+    assert poi['好评内容'] == ['好吃', {'内容': '环境好'}, '服务热情']
+    assert poi['差评内容'] == [['排队', '久']]